@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from django.conf import settings
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -82,7 +83,8 @@ WSGI_APPLICATION = "BetterDays.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # docker compose points this at a volume shared by the web and worker containers
+        "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
     }
 }
 
@@ -130,6 +132,19 @@ STATIC_URL = "static/"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# when set (e.g. "/protected-media/") media responses are X-Accel-Redirects to
+# that internal nginx location and nginx sends the file, see core/media.py
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX", "")
+
+# uploads are stored once per unique content, see core/storage.py
+STORAGES = {
+    "default": {"BACKEND": "core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# unfinished chunked uploads, kept out of MEDIA_ROOT so they are never served
+CHUNKED_UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "betterdays-uploads")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
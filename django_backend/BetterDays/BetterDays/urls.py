@@ -15,11 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import re
+
 from core.sse import accountability_stream
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework import routers
 from core.api_views import (
     ApplicationUserViewSet,
@@ -41,7 +42,9 @@ from core.api_views import (
     WorkTaskViewSet,
     HabitPartnerViewSet,
     AccountabilityPartnerViewSet,
+    UploadViewSet,
 )
+from core.media import media_view
 
 router = routers.DefaultRouter()
 router.register("users", ApplicationUserViewSet)
@@ -66,13 +69,13 @@ router.register(
 router.register("journals", JournalViewSet, basename="journals")  # Added basename
 router.register('work-notes', WorkNoteViewSet, basename='work-notes')
 router.register('work-tasks', WorkTaskViewSet, basename='work-tasks')
+router.register('uploads', UploadViewSet, basename='uploads')
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(router.urls)),
     path("auth/", include("core.urls")),
     path("api/accountability-stream/", accountability_stream, name="accountability_stream"),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # nginx proxies media here too, the view only decides and hands the file back
+    re_path(r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")), media_view, name="media"),
+]
\ No newline at end of file
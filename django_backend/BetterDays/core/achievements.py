@@ -0,0 +1,73 @@
+"""
+Declarative achievement rules.
+
+Every rule names the domain event it listens to and a threshold on a counter
+the models already keep up to date (Habit.streak_count, ApplicationUser
+note_count / followers_count). The event handlers in signals.py pass the
+counter value from before and after the change, a rule awards when that
+change crosses its threshold. Nothing here ever reads a user's history.
+
+Milestones (notes, followers) are awarded once, a counter that drops and
+climbs back over the threshold does not earn them again. Only repeatable
+rules bump ach_count again, the streak one once per run: a habit remembers
+when its streak was last awarded (Habit.streak_awarded_on), so unticking and
+ticking a day inside the same run does not count as a new streak.
+"""
+
+from .models import Achievement, AchievementType
+
+HABIT_COMPLETED = "habit_completed"
+NOTE_CREATED = "note_created"
+FOLLOWED = "followed"
+
+
+class Rule:
+    def __init__(self, name, event, threshold, description, repeatable=False):
+        self.name = name
+        self.event = event
+        self.threshold = threshold
+        self.description = description
+        self.repeatable = repeatable
+
+    def crossed(self, before, after):
+        return before < self.threshold <= after
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.event}, >= {self.threshold})"
+
+
+RULES = [
+    Rule("30 Day Streak", HABIT_COMPLETED, 30, "Kept a habit going for 30 days in a row.", repeatable=True),
+    Rule("100 Notes", NOTE_CREATED, 100, "Wrote 100 journal notes."),
+    Rule("10 Followers", FOLLOWED, 10, "Reached 10 followers."),
+]
+
+
+def rules_for(event):
+    return [rule for rule in RULES if rule.event == event]
+
+
+def award(rule, user_id):
+    # awards are rare (only on a crossing) so the type lookup is not cached,
+    # that way types deleted or renamed in the admin are simply recreated
+    achievement_type, _ = AchievementType.objects.get_or_create(
+        name=rule.name, defaults={"description": rule.description}
+    )
+    if rule.repeatable:
+        return Achievement.award(user_id, achievement_type.pk)
+    # the unique (user, type) constraint makes this safe against a concurrent award
+    achievement, created = Achievement.objects.get_or_create(
+        user_id=user_id, achievement_type=achievement_type, defaults={"ach_count": 1}
+    )
+    return achievement if created else None
+
+
+def on_event(event, user_id, before, after):
+    """
+    Awards every rule for this event whose threshold lies in (before, after],
+    returns the achievements that were earned or earned again
+    """
+    if after <= before:
+        return []
+    awarded = [award(rule, user_id) for rule in rules_for(event) if rule.crossed(before, after)]
+    return [achievement for achievement in awarded if achievement is not None]
@@ -16,7 +16,8 @@ from .models import (
     MoodCategory,
     MoodSubcategory,
     WorkNote,
-    WorkTask
+    WorkTask,
+    Job,
 )
 
 
@@ -241,4 +242,11 @@ class WorkTaskAdmin(admin.ModelAdmin):
     ]
     list_editable = ["task_name", "category", "priority", "time_spent", "completed"]
     list_filter = ["category", "priority", "completed", "date_created"]
-    search_fields = ["task_name", "description", "category"]
\ No newline at end of file
+    search_fields = ["task_name", "description", "category"]
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "attempts", "max_attempts", "run_at", "locked_by", "created_at"]
+    list_filter = ["status", "name"]
+    search_fields = ["name", "dedup_key", "last_error"]
@@ -0,0 +1,331 @@
+"""
+Server side analytics for the mood / journal screens.
+
+Everything here is aggregated in the database and returned as dense, bucketed
+series so the payload size depends on the date range and not on how many
+notes the user has written. Mood charts read the DailyMoodRollup table, so a
+year long chart sums at most a few hundred rows per category.
+
+The habit / mood correlation is computed with NumPy over a days x categories
+mood matrix and a days x habits completion matrix, the result is cached per
+user until a note or habit of theirs changes.
+"""
+
+import uuid
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import DailyMoodRollup, Habit, MoodCategory, WorkTask
+
+BUCKETS = ("day", "week", "month")
+# how far back the charts look when no ?from= is given
+DEFAULT_SPAN = {"day": timedelta(days=29), "week": timedelta(weeks=11), "month": timedelta(days=365)}
+MAX_BUCKETS = 1000
+
+CORRELATION_DAYS = 90
+MAX_CORRELATION_DAYS = 365
+# the cache is invalidated from signals, the ttl covers other processes when
+# the cache backend is not shared between them
+CORRELATION_TTL = 600
+
+
+def bucket_start(day, bucket):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucket_range(start, end, bucket):
+    """Every bucket start from the one holding start to the one holding end"""
+    current = bucket_start(start, bucket)
+    buckets = []
+    while current <= end:
+        buckets.append(current)
+        if bucket == "day":
+            current += timedelta(days=1)
+        elif bucket == "week":
+            current += timedelta(weeks=1)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+    return buckets
+
+
+def resolve_window(bucket, start=None, end=None):
+    """Fills in the default window and checks it is not too big to return"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    end = end or timezone.localdate()
+    start = start or bucket_start(end - DEFAULT_SPAN[bucket], bucket)
+    if start > end:
+        raise ValueError("from must be before to")
+    buckets = bucket_range(start, end, bucket)
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f"Range too large, at most {MAX_BUCKETS} {bucket} buckets")
+    return start, end, buckets
+
+
+def dense_series(buckets, categories, rows):
+    """
+    rows are (bucket_start, category_id, count, time_spent) tuples, the result
+    has a zero filled list per category lined up with the buckets
+    """
+    position = {day: i for i, day in enumerate(buckets)}
+    series = {
+        pk: {"id": pk, "name": name, "counts": [0] * len(buckets), "time_spent": [0] * len(buckets)}
+        for pk, name in categories
+    }
+    totals = [0] * len(buckets)
+    for day, category_id, count, time_spent in rows:
+        i = position.get(day)
+        if i is None or category_id not in series:
+            continue
+        series[category_id]["counts"][i] += count
+        series[category_id]["time_spent"][i] += time_spent or 0
+        totals[i] += count
+    return {
+        "buckets": [day.isoformat() for day in buckets],
+        "categories": list(series.values()),
+        "totals": totals,
+    }
+
+
+def day_bounds(start, end):
+    """Aware [since, until) datetimes covering two inclusive dates, keeps the datetime index usable"""
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    )
+
+
+def mood_stats(user, bucket="day", start=None, end=None):
+    """Mood counts per category per bucket for one user, summed from the daily rollups"""
+    start, end, buckets = resolve_window(bucket, start, end)
+    rows = (
+        DailyMoodRollup.objects.filter(user=user, date__gte=start, date__lte=end)
+        .annotate(bucket=Trunc("date", bucket, output_field=DateField()))
+        .values_list("bucket", "subcategory__category_id")
+        .annotate(count=Sum("count"), time_spent=Sum("time_spent_sum"))
+        .order_by()
+    )
+    categories = MoodCategory.objects.order_by("id").values_list("id", "name")
+    return {
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        **dense_series(buckets, categories, rows),
+    }
+
+
+def _task_group(rows, key):
+    """Turns (key, tasks, completed, time_spent) aggregate rows into response dicts"""
+    return [
+        {
+            key: value,
+            "tasks": tasks,
+            "completed": completed,
+            "time_spent": time_spent or 0,
+            "completion_rate": round(completed / tasks, 4) if tasks else 0,
+        }
+        for value, tasks, completed, time_spent in rows
+    ]
+
+
+def work_task_stats(user, bucket="day", start=None, end=None):
+    """
+    Time spent and completion ratios of the user's work tasks grouped by
+    category, priority and day/week, each grouping is one GROUP BY
+    """
+    start, end, buckets = resolve_window(bucket, start, end)
+    since, until = day_bounds(start, end)
+    tasks = WorkTask.objects.filter(user=user, date_created__gte=since, date_created__lt=until)
+    aggregates = {
+        "tasks": Count("id"),
+        "completed": Count("id", filter=Q(completed=True)),
+        "time_spent_sum": Sum("time_spent"),
+    }
+
+    def grouped(*fields):
+        return list(
+            tasks.values_list(*fields)
+            .annotate(**aggregates)
+            .order_by(*fields)
+        )
+
+    by_category = grouped("category")
+    by_priority = grouped("priority")
+    periods = (
+        tasks.annotate(bucket=Trunc("date_created", bucket, output_field=DateField()))
+        .values_list("bucket")
+        .annotate(**aggregates)
+        .order_by()
+    )
+    by_period = {day: row for day, *row in periods}
+
+    # totals are the sum of any one grouping, no need for another query
+    total_tasks = sum(row[1] for row in by_category)
+    total_completed = sum(row[2] for row in by_category)
+    return {
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "totals": {
+            "tasks": total_tasks,
+            "completed": total_completed,
+            "time_spent": sum(row[3] or 0 for row in by_category),
+            "completion_rate": round(total_completed / total_tasks, 4) if total_tasks else 0,
+        },
+        # blank categories are reported as "" and labelled by the client
+        "by_category": _task_group(by_category, "category"),
+        "by_priority": _task_group(by_priority, "priority"),
+        "by_period": _task_group(
+            ((day.isoformat(), *by_period.get(day, (0, 0, 0))) for day in buckets),
+            "date",
+        ),
+    }
+
+
+def _correlation_generation(user_id):
+    """Token that changes every time the user's cached correlations go stale"""
+    key = f"mood-correlation-gen:{user_id}"
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.set(key, generation, None)
+    return generation
+
+
+def invalidate_mood_correlation(user_id):
+    cache.delete(f"mood-correlation-gen:{user_id}")
+
+
+def _completion_days(completions, start, size):
+    """Row offsets (0..size-1) of the days a habit was completed inside the window"""
+    done = [day for day, completed in (completions or {}).items() if completed]
+    try:
+        days = np.array(done, dtype="datetime64[D]")
+    except ValueError:
+        # one bad key should not hide the rest
+        days = []
+        for day in done:
+            try:
+                days.append(np.datetime64(day, "D"))
+            except ValueError:
+                continue
+        days = np.array(days, dtype="datetime64[D]")
+    offsets = (days - np.datetime64(start, "D")).astype(np.int64)
+    return offsets[(offsets >= 0) & (offsets < size)]
+
+
+def _pearson(x, y):
+    """Column by column correlation of x (n x a) against y (n x b) as an a x b matrix"""
+    if x.shape[0] < 2:
+        return np.full((x.shape[1], y.shape[1]), np.nan)
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    denom = np.outer(np.sqrt((xc ** 2).sum(axis=0)), np.sqrt((yc ** 2).sum(axis=0)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = (xc.T @ yc) / denom
+    # a constant column (habit done every day, mood never seen) has no correlation
+    corr[~np.isfinite(corr)] = np.nan
+    return corr
+
+
+def _rounded(value):
+    return None if not np.isfinite(value) else round(float(value), 4)
+
+
+def compute_mood_correlation(user, days=CORRELATION_DAYS, end=None):
+    """
+    Correlation and lift of every habit against every mood category over the
+    last `days` days. Only days with at least one mood logged are used, a day
+    without notes says nothing about mood.
+
+    correlation: pearson between "habit done that day" and the share of that
+    day's notes in the category.
+    lift: P(category logged | habit done) / P(category logged), above 1 means
+    the mood shows up more often on days the habit was done.
+    """
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+
+    categories = list(MoodCategory.objects.order_by("id").values_list("id", "name"))
+    category_ids = np.array([pk for pk, _ in categories], dtype=np.int64)
+    habits = list(
+        Habit.objects.filter(user=user).order_by("id").values_list("id", "habit_name", "completions")
+    )
+
+    # days x categories note counts, straight from the rollups
+    mood = np.zeros((days, len(categories)))
+    rows = list(
+        DailyMoodRollup.objects.filter(user=user, date__gte=start, date__lte=end)
+        .values_list("date", "subcategory__category_id")
+        .annotate(count=Sum("count"))
+        .order_by()
+    )
+    if rows and len(categories):
+        dates, cats, counts = zip(*rows)
+        offsets = (np.array(dates, dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+        cols = np.searchsorted(category_ids, np.array(cats, dtype=np.int64))
+        np.add.at(mood, (offsets, cols), np.array(counts, dtype=float))
+
+    # days x habits, 1 where the habit was completed
+    done = np.zeros((days, len(habits)))
+    for j, (_, _, completions) in enumerate(habits):
+        done[_completion_days(completions, start, days), j] = 1.0
+
+    logged = mood.sum(axis=1) > 0
+    mood, done = mood[logged], done[logged]
+    observed = int(logged.sum())
+
+    share = mood / np.maximum(mood.sum(axis=1, keepdims=True), 1)
+    present = (mood > 0).astype(float)
+    corr = _pearson(done, share)
+
+    habit_days = done.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_mood = present.mean(axis=0) if observed else np.zeros(len(categories))
+        p_mood_given_habit = (done.T @ present) / habit_days[:, None]
+        lift = p_mood_given_habit / p_mood
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": observed,
+        "categories": [{"id": pk, "name": name} for pk, name in categories],
+        "habits": [
+            {
+                "id": habit_id,
+                "habit_name": name,
+                "completed_days": int(habit_days[j]),
+                "moods": [
+                    {
+                        "category_id": int(category_ids[k]),
+                        "correlation": _rounded(corr[j, k]),
+                        "lift": _rounded(lift[j, k]),
+                    }
+                    for k in range(len(categories))
+                ],
+            }
+            for j, (habit_id, name, _) in enumerate(habits)
+        ],
+    }
+
+
+def mood_correlation(user, days=CORRELATION_DAYS):
+    """Cached compute_mood_correlation, keyed on the user's current generation"""
+    if not 1 <= days <= MAX_CORRELATION_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_CORRELATION_DAYS}")
+    end = timezone.localdate()
+    key = f"mood-correlation:{user.pk}:{_correlation_generation(user.pk)}:{days}:{end.isoformat()}"
+    result = cache.get(key)
+    if result is None:
+        result = compute_mood_correlation(user, days, end)
+        cache.set(key, result, CORRELATION_TTL)
+    return result
@@ -1,5 +1,7 @@
 from django.shortcuts import render, get_object_or_404
-from django.db import models
+from django.db import connection, models
+from django.db.models import Count, Prefetch, Sum
+from django.db.models.functions import Coalesce
 
 from django.contrib.auth import get_user_model
 from .models import ApplicationUser
@@ -7,11 +9,12 @@ from .models import ApplicationUser
 from rest_framework.decorators import action
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
-from datetime import datetime  
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.exceptions import ParseError, PermissionDenied
+from datetime import datetime, time, timedelta
 
-from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 
@@ -36,7 +39,30 @@ from .models import (
     AchievementType,
     WorkNote,
     WorkTask,
+    UploadSession,
+    with_viewer_state,
 )
+from . import achievements
+from .analytics import (
+    CORRELATION_DAYS,
+    invalidate_mood_correlation,
+    mood_correlation,
+    mood_stats,
+    work_task_stats,
+)
+from .bulk import BulkModelMixin
+from .cards import get_user_card, get_user_cards
+from .catalog import catalog_response
+from .follow_graph import follow_graph
+from .pagination import (
+    JournalPagination,
+    OptionalCursorPagination,
+    OptionalNotePagination,
+    OptionalWorkNotePagination,
+)
+from .search import InvalidCursor, note_index, post_index
+from .timers import TimerConflict, start_timer, stop_timer, timer_state
+from .uploads import UploadError, create_session, finalize, session_state, write_chunk
 from .serializers import (
     ApplicationUserSerializer,
     FollowSerializer,
@@ -53,7 +79,9 @@ from .serializers import (
     AchievementTypeSerializer,
     GeneratingPostSerializer,
     JournalSerializer,
+    JournalDetailSerializer,
     WorkNoteSerializer,
+    WorkNoteSummarySerializer,
     WorkTaskSerializer
 )
 
@@ -75,10 +103,73 @@ def signup_view(request):
         return JsonResponse({"success": True})
     return JsonResponse({"error": "Invalid request"}, status=400)
 
+def parse_limit(request, default, maximum):
+    """Reads ?limit= clamped to 1..maximum, falls back to the default"""
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
+
+
+def parse_day(request, name):
+    """Reads a YYYY-MM-DD query param as a date, None when it is missing"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}. Use YYYY-MM-DD format.")
+
+
+def parse_date_range(request):
+    """
+    Reads ?from= and ?to= (YYYY-MM-DD, both inclusive) into aware datetimes,
+    the end is returned as the start of the day after so it can be used with <
+    """
+    def day_start(day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    date_from = parse_day(request, 'from')
+    date_to = parse_day(request, 'to')
+    return (
+        day_start(date_from) if date_from else None,
+        day_start(date_to + timedelta(days=1)) if date_to else None,
+    )
+
+
 class ApplicationUserViewSet(viewsets.ModelViewSet):
     queryset = ApplicationUser.objects.all()
     serializer_class = ApplicationUserSerializer
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        """Users whose username or email starts with ?prefix=, as at most ?limit= cards"""
+        prefix = request.query_params.get('prefix', '').strip().casefold()
+        if not prefix:
+            return Response({"error": "prefix is required"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = parse_limit(request, default=10, maximum=25)
+
+        # a >= / < range instead of LIKE so both lookups are plain index range
+        # scans on the folded columns, whatever the backend's LIKE rules are
+        upper = prefix + "\U0010ffff"
+        users = ApplicationUser.objects.exclude(pk=request.user.pk)
+        by_username = users.filter(
+            username_folded__gte=prefix, username_folded__lt=upper
+        ).order_by('username_folded').values_list('id', 'username_folded')[:limit]
+        by_email = users.filter(
+            email_folded__gte=prefix, email_folded__lt=upper
+        ).order_by('email_folded').values_list('id', 'username_folded')[:limit]
+
+        matches = sorted(set(by_username) | set(by_email), key=lambda row: (row[1], row[0]))
+        user_ids = [pk for pk, _ in matches[:limit]]
+        cards = get_user_cards(user_ids, request)
+        return Response([cards[pk] for pk in user_ids if pk in cards])
+
+
+MAX_STATUS_IDS = 500
+
 
 class FollowViewSet(viewsets.ModelViewSet):
     queryset = Follow.objects.all()
@@ -92,19 +183,81 @@ class FollowViewSet(viewsets.ModelViewSet):
             return Follow.objects.filter(following_id=user_id)
         return Follow.objects.none()
     
+    def _follow_list(self, request, queryset, ordering):
+        # ordering on the other user's id keeps the page a range read on the
+        # (followers, following) / (following, followers) indexes
+        paginator = OptionalCursorPagination(ordering=ordering)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is None:
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
     @action(detail=True, methods=['GET'])
     def following(self, request, pk=None):
         """Get users that the specified user follows"""
         following = Follow.objects.filter(followers_id=pk)
-        serializer = self.get_serializer(following, many=True)
-        return Response(serializer.data)
+        return self._follow_list(request, following, 'following_id')
     
     @action(detail=True, methods=['GET'])
     def followers(self, request, pk=None):
         """Get users who follow the specified user"""
         followers = Follow.objects.filter(following_id=pk)
-        serializer = self.get_serializer(followers, many=True)
-        return Response(serializer.data)
+        return self._follow_list(request, followers, 'followers_id')
+    
+    @action(detail=False, methods=['POST'], url_path='status')
+    def follow_status(self, request):
+        """
+        Follow relationship between the current user and a list of users,
+        answered from a single query on the follow indexes
+        """
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list):
+            return Response({"error": "user_ids must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > MAX_STATUS_IDS:
+            return Response(
+                {"error": f"At most {MAX_STATUS_IDS} user_ids per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            user_ids = {int(pk) for pk in user_ids}
+        except (TypeError, ValueError):
+            return Response({"error": "user_ids must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        me = request.user.id
+        edges = Follow.objects.filter(
+            models.Q(followers_id=me, following_id__in=user_ids) |
+            models.Q(following_id=me, followers_id__in=user_ids)
+        ).values_list('followers_id', 'following_id')
+        
+        following, followed_by = set(), set()
+        for follower_id, following_id in edges:
+            if follower_id == me:
+                following.add(following_id)
+            else:
+                followed_by.add(follower_id)
+        
+        return Response({
+            str(pk): {
+                "following": pk in following,
+                "followed_by": pk in followed_by,
+                "mutual": pk in following and pk in followed_by,
+            }
+            for pk in user_ids
+        })
+    
+    @action(detail=False, methods=['GET'])
+    def suggestions(self, request):
+        """People you may know, friends of friends from the in memory follow graph"""
+        limit = parse_limit(request, default=10, maximum=50)
+        suggestions = follow_graph.suggestions(request.user.id, limit=limit)
+        cards = get_user_cards([pk for pk, _, _ in suggestions], request)
+        return Response([
+            {**cards[pk], "mutual_count": mutual_count, "follows_you": follows_you}
+            for pk, mutual_count, follows_you in suggestions
+            if pk in cards
+        ])
     
     @action(detail=False, methods=['POST'])
     def toggle(self, request):
@@ -114,37 +267,72 @@ class FollowViewSet(viewsets.ModelViewSet):
         if not following_id:
             return Response({"error": "following_id is required"}, status=status.HTTP_400_BAD_REQUEST)
             
-        try:
-            following_user = ApplicationUser.objects.get(pk=following_id)
-        except ApplicationUser.DoesNotExist:
+        if not ApplicationUser.objects.filter(pk=following_id).exists():
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
             
         # Check if user is trying to follow themselves
-        if request.user.id == following_user.id:
+        if str(request.user.id) == str(following_id):
             return Response({"error": "You cannot follow yourself"}, status=status.HTTP_400_BAD_REQUEST)
             
-        # Check if follow relationship already exists
-        try:
-            follow = Follow.objects.get(followers=request.user, following=following_user)
-            # If exists, unfollow
-            follow.delete()
-            return Response({"status": "unfollowed"}, status=status.HTTP_200_OK)
-        except Follow.DoesNotExist:
-            # Create new follow relationship
-            follow = Follow(followers=request.user, following=following_user)
-            follow.save()
+        # single transaction, the unique constraint stops duplicates and the
+        # counters are bumped with F() instead of recounting both users
+        if Follow.toggle(request.user.id, following_id):
             return Response({"status": "following"}, status=status.HTTP_201_CREATED)
+        return Response({"status": "unfollowed"}, status=status.HTTP_200_OK)
 
 
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
+    def get_queryset(self):
+        queryset = with_viewer_state(
+            Post.objects.select_related("user"), self.request.user, PostLike, "post"
+        )
+        # ?sort=trending reads straight off post_trending_idx, the score is
+        # precomputed so nothing gets sorted by formula at request time
+        if self.action == "list" and self.request.query_params.get("sort") == "trending":
+            queryset = queryset.order_by("-trending_score", "-id")
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full text search over post titles and descriptions"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = parse_limit(request, default=20, maximum=50)
+
+        try:
+            hits, next_cursor = post_index.search(
+                query, cursor=request.query_params.get('cursor'), limit=limit
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        posts = self.get_queryset().in_bulk([pk for pk, _, _ in hits])
+        results = []
+        for pk, score, snippets in hits:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            data = PostSerializer(post, context={'request': request}).data
+            data['rank'] = score
+            data['title_snippet'] = snippets.get('post_title')
+            data['description_snippet'] = snippets.get('post_description')
+            results.append(data)
+        return Response({"next": next_cursor, "results": results})
+
 
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
 
+    def get_queryset(self):
+        return with_viewer_state(
+            Comment.objects.all(), self.request.user, CommentLike, "comment"
+        )
+
 
 class PostLikeViewSet(viewsets.ModelViewSet):
     queryset = PostLike.objects.all()
@@ -161,31 +349,150 @@ class CommentLikeViewSet(viewsets.ModelViewSet):
 #     serializer_class = AccountabilityPartnerSerializer
 
 
-class MoodCategoryViewSet(viewsets.ModelViewSet):
+class MoodCatalogMixin:
+    """
+    Lists come from the pre serialized catalog cache with an ETag, reads
+    skip the session/user lookup since the catalog is the same for everyone
+    """
+    catalog_kind = None
+
+    def perform_authentication(self, request):
+        if request.method not in SAFE_METHODS:
+            super().perform_authentication(request)
+
+    def list(self, request, *args, **kwargs):
+        return catalog_response(self.catalog_kind, request)
+
+
+class MoodCategoryViewSet(MoodCatalogMixin, viewsets.ModelViewSet):
     queryset = MoodCategory.objects.all()
     serializer_class = MoodCategorySerializer
+    catalog_kind = "categories"
 
 
-class MoodSubcategoryViewSet(viewsets.ModelViewSet):
-    queryset = MoodSubcategory.objects.all()
+class MoodSubcategoryViewSet(MoodCatalogMixin, viewsets.ModelViewSet):
+    queryset = MoodSubcategory.objects.select_related('category')
     serializer_class = MoodSubcategorySerializer
+    catalog_kind = "subcategories"
 
 
-class NoteViewSet(viewsets.ModelViewSet):
+class NoteViewSet(BulkModelMixin, viewsets.ModelViewSet):
     queryset = Note.objects.all()
     serializer_class = NoteSerializer
     permission_classes = [
         IsAuthenticated
     ]  # user needs to be authenticated to see their notes
+    # plain list unless ?cursor= / ?page_size= is sent
+    pagination_class = OptionalNotePagination
 
     def get_queryset(self):
-        return Note.objects.filter(
+        notes = Note.objects.filter(
             user=self.request.user
         )  # Just return notes taht belong to certain user
+        if self.action == 'list':
+            try:
+                date_from, date_to = parse_date_range(self.request)
+            except ValueError as e:
+                raise ParseError(str(e))
+            if date_from:
+                notes = notes.filter(note_date_created__gte=date_from)
+            if date_to:
+                notes = notes.filter(note_date_created__lt=date_to)
+        return notes
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    # bulk writes skip Note.save/delete, these keep the rollups and
+    # partnerships right for the whole batch instead
+    def perform_bulk_create(self, notes):
+        notes = Note.bulk_create_notes(notes)
+        invalidate_mood_correlation(self.request.user.pk)
+        # one achievement check for the whole batch, no post_save per note
+        count = ApplicationUser.objects.filter(pk=self.request.user.pk).values_list(
+            'note_count', flat=True
+        ).first() or 0
+        achievements.on_event(achievements.NOTE_CREATED, self.request.user.pk, count - len(notes), count)
+        return notes
+
+    def perform_bulk_update(self, changes, fields):
+        old_states = [note._stored_rollup_state() for note, _ in changes]
+        notes = Note.bulk_update_notes(self.apply_bulk_changes(changes), fields, old_states)
+        invalidate_mood_correlation(self.request.user.pk)
+        return notes
+
+    def perform_bulk_destroy(self, notes):
+        Note.bulk_delete_notes(notes)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full text search over the user's own notes, optionally narrowed
+        by ?mood= (subcategory id), ?habit=, ?from= and ?to= (YYYY-MM-DD)
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = parse_limit(request, default=20, maximum=50)
+
+        ops = connection.ops
+        where = [("src.user_id = %s", [request.user.id])]
+        try:
+            for param, column in (('mood', 'mood_subcategory_id'), ('habit', 'Habit_id')):
+                value = request.query_params.get(param)
+                if value:
+                    where.append((f"src.{ops.quote_name(column)} = %s", [int(value)]))
+            date_from, date_to = parse_date_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if date_from:
+            where.append((
+                "src.note_date_created >= %s",
+                [ops.adapt_datetimefield_value(date_from)],
+            ))
+        if date_to:
+            where.append((
+                "src.note_date_created < %s",
+                [ops.adapt_datetimefield_value(date_to)],
+            ))
+
+        try:
+            hits, next_cursor = note_index.search(
+                query, where=where, cursor=request.query_params.get('cursor'), limit=limit
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        notes = self.get_queryset().in_bulk([pk for pk, _, _ in hits])
+        results = []
+        for pk, score, snippets in hits:
+            note = notes.get(pk)
+            if note is None:
+                continue
+            data = NoteSerializer(note, context={'request': request}).data
+            data['rank'] = score
+            data['caption_snippet'] = snippets.get('note_caption')
+            data['content_snippet'] = snippets.get('note_content')
+            results.append(data)
+        return Response({"next": next_cursor, "results": results})
+
+    @action(detail=False, methods=['get'], url_path='mood-stats')
+    def mood_stats(self, request):
+        """
+        Mood counts per category bucketed by ?bucket=day|week|month between
+        ?from= and ?to=, zero filled so the charts can plot it directly
+        """
+        try:
+            stats = mood_stats(
+                request.user,
+                bucket=request.query_params.get('bucket', 'day'),
+                start=parse_day(request, 'from'),
+                end=parse_day(request, 'to'),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats)
+
     # to retrieve individual note of a user
     def get_object(self):
         obj = super().get_object()
@@ -212,6 +519,19 @@ class HabitViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['get'], url_path='mood-correlation')
+    def mood_correlation(self, request):
+        """
+        Correlation and lift of each of the user's habits against each mood
+        category over the last ?days= days (default 90)
+        """
+        try:
+            days = int(request.query_params.get('days', CORRELATION_DAYS))
+            result = mood_correlation(request.user, days)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
     @action(detail=True, methods=['post'])
     def mark_completed(self, request, pk=None):
         habit = self.get_object()
@@ -272,13 +592,36 @@ class GeneratingPostViewSet(viewsets.ViewSet):
 
 
 class JournalViewSet(viewsets.ViewSet):
+    """
+    The user's journal newest first, paged with ?cursor= and windowed with
+    ?from= / ?to=. Rows are summaries unless ?full=1 is passed
+    """
     serializer_class = JournalSerializer
+    permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        serializer = JournalSerializer(
-            instance={"user": request.user}, context={"request": request}
+        try:
+            date_from, date_to = parse_date_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        notes = Note.objects.filter(user=request.user).select_related(
+            'mood_subcategory__category'
         )
-        return Response(serializer.data)
+        if date_from:
+            notes = notes.filter(note_date_created__gte=date_from)
+        if date_to:
+            notes = notes.filter(note_date_created__lt=date_to)
+
+        full = request.query_params.get('full') in ('1', 'true')
+        serializer_class = JournalDetailSerializer if full else JournalSerializer
+        if serializer_class.summary_columns:
+            notes = notes.only(*serializer_class.summary_columns)
+
+        paginator = JournalPagination()
+        page = paginator.paginate_queryset(notes, request, view=self)
+        serializer = serializer_class(page, many=True, context={"request": request})
+        return Response({"next": paginator.get_next_link(), "notes": serializer.data})
     
     
 
@@ -287,14 +630,35 @@ class JournalViewSet(viewsets.ViewSet):
 class WorkNoteViewSet(viewsets.ModelViewSet):
     # permission_classes = [permissions.IsAuthenticated]
     serializer_class = WorkNoteSerializer
-    
+    pagination_class = OptionalWorkNotePagination
+
+    def is_summary(self):
+        return self.action == 'list' and self.request.query_params.get('summary') in ('1', 'true')
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return WorkNoteSummarySerializer
+        return WorkNoteSerializer
+
     def get_queryset(self):
-        return WorkNote.objects.filter(user=self.request.user)
+        # same order as the cursor pages so plain and paged lists agree
+        notes = WorkNote.objects.filter(user=self.request.user).order_by('-date_created', '-id')
+        if self.is_summary():
+            # totals per note from one grouped query, the tasks are never loaded
+            return notes.annotate(
+                task_count=Count('tasks'),
+                completed_count=Count('tasks', filter=models.Q(tasks__completed=True)),
+                total_time=Coalesce(Sum('tasks__time_spent'), 0),
+            )
+        # all tasks for the page in one extra query instead of one per note
+        return notes.prefetch_related(
+            Prefetch('tasks', queryset=WorkTask.objects.filter(user=self.request.user))
+        )
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class WorkTaskViewSet(viewsets.ModelViewSet):
+class WorkTaskViewSet(BulkModelMixin, viewsets.ModelViewSet):
     # permission_classes = [permissions.IsAuthenticated]
     serializer_class = WorkTaskSerializer
     
@@ -303,6 +667,94 @@ class WorkTaskViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def stats(self, request):
+        """
+        Time spent and completion rates grouped by category, priority and
+        ?bucket=day|week between ?from= and ?to=, aggregated in the database
+        """
+        try:
+            stats = work_task_stats(
+                request.user,
+                bucket=request.query_params.get('bucket', 'day'),
+                start=parse_day(request, 'from'),
+                end=parse_day(request, 'to'),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats)
+
+    # timer endpoints only append start/stop events, the minutes reach
+    # time_spent when flush_work_timers runs
+    @action(detail=True, methods=['get'])
+    def timer(self, request, pk=None):
+        return Response(timer_state(self.get_object()))
+
+    @action(detail=True, methods=['post'], url_path='timer/start')
+    def timer_start(self, request, pk=None):
+        return Response(start_timer(self.get_object(), request.user))
+
+    @action(detail=True, methods=['post'], url_path='timer/stop')
+    def timer_stop(self, request, pk=None):
+        try:
+            return Response(stop_timer(self.get_object(), request.user))
+        except TimerConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadViewSet(viewsets.ViewSet):
+    """
+    Resumable chunked image uploads, see uploads.py for the protocol. The
+    PUT body is raw bytes and is streamed to disk, it never goes through a
+    parser.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, request, pk):
+        try:
+            return UploadSession.objects.get(pk=pk, user=request.user)
+        except (UploadSession.DoesNotExist, ValueError, ValidationError):
+            raise Http404
+
+    @staticmethod
+    def error_response(e):
+        return Response({"error": str(e), **e.extra}, status=e.status)
+
+    def create(self, request):
+        try:
+            session = create_session(request.user, request.data)
+        except UploadError as e:
+            return self.error_response(e)
+        return Response(session_state(session), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(session_state(self.get_session(request, pk)))
+
+    def update(self, request, pk=None):
+        session = self.get_session(request, pk)
+        content_length = request.META.get('CONTENT_LENGTH')
+        try:
+            write_chunk(
+                session,
+                request.META.get('HTTP_CONTENT_RANGE'),
+                request.stream,
+                int(content_length) if content_length else None,
+            )
+        except UploadError as e:
+            return self.error_response(e)
+        return Response(session_state(session))
+
+    def destroy(self, request, pk=None):
+        self.get_session(request, pk).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        try:
+            return Response(finalize(self.get_session(request, pk), request))
+        except UploadError as e:
+            return self.error_response(e)
         
         
         
@@ -318,22 +770,19 @@ class AccountabilityPartnerViewSet(viewsets.ViewSet):
     def list(self, request):
         user = request.user # retrieve users aprtners
         
-        # Find all partnerships where the user is either the user or partner
-        partnerships = AccountabilityPartner.objects.filter(
+        # only the id pairs are needed, the partner users come back as cards
+        # in one batch instead of a lazy FK load per partnership
+        pairs = AccountabilityPartner.objects.filter(
             models.Q(user=user) | models.Q(partner=user),
             is_active=True
-        )
-        
-        # Extract the partners to a separate list (for each in partnershp)
-        partners = []
-        for partnership in partnerships:
-            if partnership.user == user:
-                partners.append(partnership.partner)
-            else:
-                partners.append(partnership.user)
+        ).values_list('user_id', 'partner_id')
         
-        serializer = ApplicationUserSerializer(partners, many=True)
-        return Response(serializer.data)
+        partner_ids = [
+            partner_id if user_id == user.id else user_id
+            for user_id, partner_id in pairs
+        ]
+        cards = get_user_cards(partner_ids, request)
+        return Response([cards[pk] for pk in partner_ids if pk in cards])
     
     @action(detail=False, methods=['post'])
     # function to add partner by either email or username
@@ -382,15 +831,13 @@ class AccountabilityPartnerViewSet(viewsets.ViewSet):
                 # Reactivate the partnership
                 existing_partnership.is_active = True
                 existing_partnership.save()
-                serializer = ApplicationUserSerializer(partner)
-                return Response(serializer.data)
+                return Response(get_user_card(partner.id, request))
         
         # creates new partnership
         try:
             partnership = AccountabilityPartner(user=user, partner=partner)
             partnership.save()
-            serializer = ApplicationUserSerializer(partner)
-            return Response(serializer.data)
+            return Response(get_user_card(partner.id, request))
         except Exception as e:
             return Response(
                 {"error": str(e)},
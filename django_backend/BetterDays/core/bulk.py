@@ -0,0 +1,226 @@
+"""
+Bulk create / update / delete for model viewsets.
+
+One request carries a list of items. Every item is validated on its own so a
+bad row does not sink the rest, the valid ones are written with bulk_create /
+bulk_update / one DELETE inside a single transaction and the response has a
+status per item, in input order:
+
+    POST   /<resource>/bulk/   [{...}, {...}]
+    PATCH  /<resource>/bulk/   [{"id": 1, ...}, {"id": 2, ...}]
+    DELETE /<resource>/bulk/   {"ids": [1, 2, 3]}
+
+Neither bulk_create nor bulk_update sends post_save, so media reference
+counts and image variants for the whole batch come from
+signals.count_bulk_media_references. bulk_update also skips Field.pre_save,
+which is what writes a new upload to storage, so changed file fields are
+committed when the changes are applied.
+"""
+
+from django.db import models, transaction
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .signals import count_bulk_media_references
+
+MAX_BULK_ITEMS = 500
+
+
+def _commit_files(obj, names):
+    # bulk_update does not call pre_save, which for a FileField writes a new
+    # upload to storage and sets its name
+    for field in obj._meta.concrete_fields:
+        if isinstance(field, models.FileField) and field.name in names:
+            field.pre_save(obj, False)
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer that validates every item independently. Invalid items
+    come back as None in validated_data and their errors are kept in
+    item_errors, both lined up with the input. For updates each item is
+    validated against its own row from instance_map.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.instance_map = kwargs.pop("instance_map", None)
+        super().__init__(*args, **kwargs)
+
+    def run_child_validation(self, data):
+        if self.instance_map is not None:
+            self.child.instance = self.instance_map[_as_id(data.get("id"))]
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+
+    def to_internal_value(self, data):
+        validated = []
+        self.item_errors = []
+        for item in data:
+            try:
+                validated.append(self.run_child_validation(item))
+                self.item_errors.append(None)
+            except serializers.ValidationError as exc:
+                validated.append(None)
+                self.item_errors.append(exc.detail)
+        return validated
+
+
+class BulkModelMixin:
+    """
+    Adds the bulk action to a ModelViewSet. The perform_bulk_* hooks can be
+    overridden when a model has side effects its save()/delete() normally
+    take care of, bulk writes skip those.
+    """
+
+    bulk_max_items = MAX_BULK_ITEMS
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        if request.method == 'DELETE':
+            ids = request.data.get('ids') if isinstance(request.data, dict) else None
+            if not isinstance(ids, list):
+                return Response({"error": "ids must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+            items = ids
+        else:
+            items = request.data
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                return Response({"error": "Expected a list of objects"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {"error": f"At most {self.bulk_max_items} items per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if request.method == 'POST':
+            results = self.bulk_create(items)
+        elif request.method == 'PATCH':
+            results = self.bulk_update(items)
+        else:
+            results = self.bulk_destroy(items)
+
+        failed = sum(1 for result in results if result["status"] in ("error", "not_found"))
+        return Response({"succeeded": len(results) - failed, "failed": failed, "results": results})
+
+    def get_bulk_serializer(self, items, instance_map=None):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        partial = instance_map is not None
+        return BulkListSerializer(
+            child=serializer_class(context=context, partial=partial),
+            data=items,
+            context=context,
+            partial=partial,
+            instance_map=instance_map,
+        )
+
+    def bulk_create(self, items):
+        serializer = self.get_bulk_serializer(items)
+        serializer.is_valid()
+        model = self.get_queryset().model
+        results = [None] * len(items)
+        pending = []
+        for index, (data, errors) in enumerate(zip(serializer.validated_data, serializer.item_errors)):
+            if errors:
+                results[index] = {"index": index, "status": "error", "errors": errors}
+            else:
+                pending.append((index, model(**self.get_bulk_defaults(), **data)))
+
+        if pending:
+            with transaction.atomic():
+                created = self.perform_bulk_create([obj for _, obj in pending])
+                count_bulk_media_references(created, created=True)
+            output = self.get_serializer(created, many=True).data
+            for (index, _), data in zip(pending, output):
+                results[index] = {"index": index, "status": "created", "id": data["id"], "data": data}
+        return results
+
+    def bulk_update(self, items):
+        results = [None] * len(items)
+        instances = self.get_queryset().in_bulk(
+            [pk for pk in (_as_id(item.get('id')) for item in items) if pk is not None]
+        )
+        to_validate = []
+        for index, item in enumerate(items):
+            pk = _as_id(item.get('id'))
+            if pk is None:
+                results[index] = {"index": index, "status": "error", "errors": {"id": ["A valid id is required."]}}
+            elif pk not in instances:
+                results[index] = {"index": index, "status": "not_found", "id": pk}
+            else:
+                to_validate.append((index, item))
+
+        serializer = self.get_bulk_serializer([item for _, item in to_validate], instance_map=instances)
+        serializer.is_valid()
+        changed = {}
+        fields = set()
+        for (index, item), data, errors in zip(to_validate, serializer.validated_data, serializer.item_errors):
+            if errors:
+                results[index] = {"index": index, "status": "error", "errors": errors}
+                continue
+            obj = instances[_as_id(item['id'])]
+            if obj.pk in changed:
+                results[index] = {"index": index, "status": "error", "errors": {"id": ["Duplicate id in this request."]}}
+                continue
+            changed[obj.pk] = (index, obj, data)
+            fields.update(data)
+
+        if changed:
+            entries = list(changed.values())
+            with transaction.atomic():
+                updated = self.perform_bulk_update(
+                    [(obj, data) for _, obj, data in entries], sorted(fields)
+                )
+                count_bulk_media_references(updated, fields=fields)
+            output = self.get_serializer(updated, many=True).data
+            for (index, obj, _), data in zip(entries, output):
+                results[index] = {"index": index, "status": "updated", "id": obj.pk, "data": data}
+        return results
+
+    def bulk_destroy(self, ids):
+        ids = [_as_id(pk) for pk in ids]
+        found = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+        if found:
+            with transaction.atomic():
+                self.perform_bulk_destroy(list(found.values()))
+        return [
+            {"index": index, "status": "deleted" if pk in found else "not_found", "id": pk}
+            for index, pk in enumerate(ids)
+        ]
+
+    # -- hooks ----------------------------------------------------------
+
+    def get_bulk_defaults(self):
+        """Fields set on every created object, like perform_create's save() kwargs"""
+        return {"user": self.request.user}
+
+    def perform_bulk_create(self, objs):
+        return self.get_queryset().model.objects.bulk_create(objs)
+
+    @staticmethod
+    def apply_bulk_changes(changes):
+        objs = []
+        for obj, data in changes:
+            for attr, value in data.items():
+                setattr(obj, attr, value)
+            _commit_files(obj, data)
+            objs.append(obj)
+        return objs
+
+    def perform_bulk_update(self, changes, fields):
+        """changes is a list of (instance, validated_data)"""
+        objs = self.apply_bulk_changes(changes)
+        if fields:
+            self.get_queryset().model.objects.bulk_update(objs, fields)
+        return objs
+
+    def perform_bulk_destroy(self, objs):
+        self.get_queryset().model.objects.filter(pk__in=[obj.pk for obj in objs]).delete()
@@ -0,0 +1,94 @@
+"""
+Lean "user card" representation (id, username, avatar url and its resized
+variants) used wherever a user is embedded in another response.
+
+Cards are kept in a small per process LRU so hot users (partners, people with
+lots of followers) are not read again on every request, the entry is dropped
+from signals whenever the user is saved or deleted. Other worker processes do
+not see that signal so entries also expire after CARD_TTL seconds.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.files.storage import default_storage
+
+from .images import variant_urls
+
+CARD_CACHE_SIZE = 4096
+CARD_TTL = 300
+
+_cards = OrderedDict()
+_lock = Lock()
+
+
+def _avatar_url(image_name, request=None):
+    if not image_name:
+        return None
+    url = default_storage.url(image_name)
+    # same output as DRF's ImageField so the frontend sees no difference
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def _cached(user_id, now):
+    entry = _cards.get(user_id)
+    if entry is None or entry[0] < now:
+        return None
+    _cards.move_to_end(user_id)
+    return entry[1]
+
+
+def get_user_cards(user_ids, request=None):
+    """
+    Returns {user_id: card} for every existing id, all cache misses are loaded
+    with a single query
+    """
+    from .models import ApplicationUser
+
+    user_ids = {int(pk) for pk in user_ids if pk is not None}
+    now = time.monotonic()
+    found = {}
+    with _lock:
+        for pk in user_ids:
+            raw = _cached(pk, now)
+            if raw is not None:
+                found[pk] = raw
+
+    missing = user_ids - found.keys()
+    if missing:
+        rows = ApplicationUser.objects.filter(pk__in=missing).values_list(
+            "id", "username", "profile_image"
+        )
+        with _lock:
+            for pk, username, image in rows:
+                raw = (pk, username, image or None)
+                found[pk] = raw
+                _cards[pk] = (now + CARD_TTL, raw)
+                _cards.move_to_end(pk)
+            while len(_cards) > CARD_CACHE_SIZE:
+                _cards.popitem(last=False)
+
+    return {
+        pk: {
+            "id": pk,
+            "username": username,
+            "profile_image": _avatar_url(image, request),
+            "profile_image_variants": variant_urls(image, request),
+        }
+        for pk, (_, username, image) in found.items()
+    }
+
+
+def get_user_card(user_id, request=None):
+    return get_user_cards([user_id], request).get(int(user_id))
+
+
+def invalidate_user_card(user_id):
+    with _lock:
+        _cards.pop(user_id, None)
+
+
+def clear_user_cards():
+    with _lock:
+        _cards.clear()
@@ -0,0 +1,79 @@
+"""
+Pre serialized mood catalog (categories and subcategories).
+
+The catalog only changes when mood_data runs or someone edits it in the
+admin, so each list is rendered to JSON once per process and served from
+memory with a strong ETag. Clients revalidating with If-None-Match get a 304
+without touching the database. Entries are dropped from signals on any
+catalog save/delete, and expire after CATALOG_TTL seconds so other worker
+processes pick up edits too.
+
+The cache is filled on the first request rather than at startup, querying
+the database from AppConfig.ready() breaks migrate on a fresh database.
+"""
+
+import hashlib
+import time
+from threading import Lock
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+CATALOG_TTL = 3600
+CATALOG_MAX_AGE = 86400
+
+_entries = {}
+_lock = Lock()
+
+
+def _render(kind, request):
+    from .models import MoodCategory, MoodSubcategory
+    from .serializers import MoodCategorySerializer, MoodSubcategorySerializer
+
+    if kind == "categories":
+        data = MoodCategorySerializer(MoodCategory.objects.order_by("id"), many=True).data
+    else:
+        data = MoodSubcategorySerializer(
+            MoodSubcategory.objects.select_related("category").order_by("id"),
+            many=True,
+            context={"request": request},
+        ).data
+    body = JSONRenderer().render(data)
+    return body, '"%s"' % hashlib.sha256(body).hexdigest()
+
+
+def get_catalog(kind, request):
+    """(json bytes, etag) for "categories" or "subcategories" """
+    # image urls are absolute, so one entry per host the api is reached on
+    key = (kind, request.build_absolute_uri("/"))
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1], entry[2]
+    body, etag = _render(kind, request)
+    with _lock:
+        _entries[key] = (now + CATALOG_TTL, body, etag)
+    return body, etag
+
+
+def clear_catalog():
+    with _lock:
+        _entries.clear()
+
+
+def catalog_response(kind, request):
+    body, etag = get_catalog(kind, request)
+    # weak comparison like the rfc says for If-None-Match
+    sent = {
+        tag[2:] if tag.startswith("W/") else tag
+        for tag in parse_etags(request.headers.get("If-None-Match", ""))
+    }
+    if etag in sent or "*" in sent:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = f"public, max-age={CATALOG_MAX_AGE}"
+    return response
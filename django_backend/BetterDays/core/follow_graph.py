@@ -0,0 +1,197 @@
+"""
+In memory follow graph used for "people you may know" suggestions.
+
+The Follow table is loaded once into two compressed sparse row (CSR)
+adjacency structures, one for who each user follows and one for who follows
+them. Follows made after the load are kept in a small add/remove overlay fed
+by the Follow signals, once the overlay gets big (or the graph gets old, other
+worker processes change follows too) the arrays are rebuilt from the table.
+
+Friends of friends are scored with array operations, so a suggestion request
+never runs multi hop self joins on core_follow.
+"""
+
+import time
+from threading import RLock
+
+import numpy as np
+
+MAX_OVERLAY_EDGES = 5000
+MAX_GRAPH_AGE = 600
+# someone who already follows you counts as much as this many mutual follows
+FOLLOWS_YOU_WEIGHT = 2
+
+
+def _csr(src, dst, size):
+    order = np.lexsort((dst, src))
+    src, dst = src[order], dst[order]
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=size), out=indptr[1:])
+    return indptr, dst
+
+
+def _gather(indptr, indices, rows):
+    """Concatenated neighbour lists of every row, without a python loop"""
+    rows = rows[(rows >= 0) & (rows < len(indptr) - 1)]
+    if not len(rows):
+        return np.empty(0, dtype=np.int64)
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    # offset of every element: its row start plus its position inside the row
+    row_offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return indices[row_offsets + np.arange(total)]
+
+
+class FollowGraph:
+    def __init__(self):
+        self._lock = RLock()
+        self._built_at = None
+        self._out = self._in = None
+        self._added = set()
+        self._removed = set()
+
+    # -- maintenance ----------------------------------------------------
+
+    def rebuild(self):
+        from .models import Follow
+
+        # held for the whole load, a follow signal arriving meanwhile waits and
+        # is applied on top instead of being wiped by the clear() below
+        with self._lock:
+            edges = np.fromiter(
+                (
+                    value
+                    for pair in Follow.objects.values_list("followers_id", "following_id").iterator()
+                    for value in pair
+                ),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            src, dst = edges[:, 0], edges[:, 1]
+            size = int(edges.max()) + 1 if len(edges) else 0
+            self._out = _csr(src, dst, size)
+            self._in = _csr(dst, src, size)
+            self._added.clear()
+            self._removed.clear()
+            self._built_at = time.monotonic()
+
+    def mark_stale(self):
+        with self._lock:
+            self._built_at = None
+
+    def add_edge(self, follower_id, following_id):
+        with self._lock:
+            # never built in this process, the first query loads the table
+            if self._out is None:
+                return
+            edge = (follower_id, following_id)
+            if edge in self._removed:
+                self._removed.discard(edge)
+            elif not self._in_base(edge):
+                self._added.add(edge)
+            self._check_overlay()
+
+    def remove_edge(self, follower_id, following_id):
+        with self._lock:
+            if self._out is None:
+                return
+            edge = (follower_id, following_id)
+            if edge in self._added:
+                self._added.discard(edge)
+            elif self._in_base(edge):
+                self._removed.add(edge)
+            self._check_overlay()
+
+    def _in_base(self, edge):
+        """Whether the edge is in the loaded arrays, rows are sorted so this is a binary search"""
+        if self._out is None:
+            return False
+        indptr, indices = self._out
+        follower_id, following_id = edge
+        if not 0 <= follower_id < len(indptr) - 1:
+            return False
+        row = indices[indptr[follower_id]:indptr[follower_id + 1]]
+        pos = np.searchsorted(row, following_id)
+        return bool(pos < len(row) and row[pos] == following_id)
+
+    def _check_overlay(self):
+        if len(self._added) + len(self._removed) > MAX_OVERLAY_EDGES:
+            # the next query rebuilds from the table, the overlay is not needed
+            self._built_at = None
+            self._added.clear()
+            self._removed.clear()
+
+    def _ensure_fresh(self):
+        # callers hold the lock, the lock is reentrant so rebuild() can take it again
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > MAX_GRAPH_AGE:
+            self.rebuild()
+
+    # -- queries --------------------------------------------------------
+
+    @staticmethod
+    def _overlay(edges, column, rows):
+        """Other end of every overlay edge whose `column` end is in rows"""
+        if not edges:
+            return np.empty(0, dtype=np.int64)
+        pairs = np.array(list(edges), dtype=np.int64)
+        return pairs[np.isin(pairs[:, column], rows), 1 - column]
+
+    def _neighbours(self, csr, column, rows, added, removed):
+        """
+        Multiset of neighbours of all rows, as (ids, counts) with the overlay
+        applied: base edges + added edges - removed edges
+        """
+        ids, counts = np.unique(
+            np.concatenate([_gather(*csr, rows), self._overlay(added, column, rows)]),
+            return_counts=True,
+        )
+        gone, gone_counts = np.unique(
+            self._overlay(removed, column, rows), return_counts=True
+        )
+        if len(gone) and len(ids):
+            pos = np.minimum(np.searchsorted(ids, gone), len(ids) - 1)
+            hit = ids[pos] == gone
+            counts[pos[hit]] -= gone_counts[hit]
+            keep = counts > 0
+            ids, counts = ids[keep], counts[keep]
+        return ids, counts
+
+    def suggestions(self, user_id, limit=10):
+        """
+        Returns [(user_id, mutual_count, follows_you)] ranked by how many of the
+        people you follow also follow them, people already following you get a boost
+        """
+        with self._lock:
+            self._ensure_fresh()
+            out_csr, in_csr = self._out, self._in
+            added, removed = set(self._added), set(self._removed)
+
+        me = np.array([user_id], dtype=np.int64)
+        following, _ = self._neighbours(out_csr, 0, me, added, removed)
+        followers, _ = self._neighbours(in_csr, 1, me, added, removed)
+
+        second_hop, mutual = self._neighbours(out_csr, 0, following, added, removed)
+        # followers of mine that i don't follow back are candidates too
+        candidates = np.union1d(second_hop, followers)
+        mutual_counts = np.zeros(len(candidates), dtype=np.int64)
+        mutual_counts[np.searchsorted(candidates, second_hop)] = mutual
+        follows_you = np.isin(candidates, followers)
+
+        keep = ~np.isin(candidates, following) & (candidates != user_id)
+        candidates = candidates[keep]
+        mutual_counts = mutual_counts[keep]
+        follows_you = follows_you[keep]
+
+        scores = mutual_counts + FOLLOWS_YOU_WEIGHT * follows_you
+        # best score first, ties go to the lower (older) user id
+        top = np.lexsort((candidates, -scores))[:limit]
+        return [
+            (int(candidates[i]), int(mutual_counts[i]), bool(follows_you[i]))
+            for i in top
+        ]
+
+
+follow_graph = FollowGraph()
@@ -0,0 +1,199 @@
+"""
+Resized variants of uploaded images.
+
+Every uploaded image gets a small thumbnail, a medium size copy and a WebP
+copy of the medium one, written next to the media root under variants/. The
+work is done with Pillow on a small thread pool after the upload's transaction
+commits, so the request that stored the image never waits for it.
+
+Variant names are worked out from the original name alone, serializers only
+list the ones that already exist on disk and the client falls back to the
+original until then.
+"""
+
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# name: (max width/height, output format or None to keep jpeg/png)
+VARIANTS = OrderedDict([
+    ("thumb", (160, None)),
+    ("medium", (800, None)),
+    ("webp", (800, "WEBP")),
+])
+VARIANT_DIR = "variants"
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 80, "method": 4},
+}
+# sources that may carry transparency are kept as png, the rest become jpeg
+ALPHA_EXTENSIONS = (".png", ".gif", ".webp")
+MAX_WORKERS = 2
+
+# positive existence checks are remembered so rendering a feed does not stat
+# every variant on every request, missing ones are checked again next time
+READY_CACHE_SIZE = 8192
+_ready = OrderedDict()
+_ready_lock = Lock()
+
+_executor = None
+_executor_lock = Lock()
+
+
+def variant_storage():
+    # variants are plain files under the media root, whatever storage the
+    # originals use
+    return FileSystemStorage(location=settings.MEDIA_ROOT, base_url=settings.MEDIA_URL)
+
+
+def variant_name(name, variant):
+    stem, ext = os.path.splitext(name)
+    if VARIANTS[variant][1] == "WEBP":
+        ext = ".webp"
+    else:
+        ext = ".png" if ext.lower() in ALPHA_EXTENSIONS else ".jpg"
+    return f"{VARIANT_DIR}/{stem}_{variant}{ext}"
+
+
+def _is_ready(storage, name):
+    with _ready_lock:
+        if name in _ready:
+            _ready.move_to_end(name)
+            return True
+    if not storage.exists(name):
+        return False
+    _mark_ready(name)
+    return True
+
+
+def _mark_ready(name):
+    with _ready_lock:
+        _ready[name] = True
+        _ready.move_to_end(name)
+        while len(_ready) > READY_CACHE_SIZE:
+            _ready.popitem(last=False)
+
+
+def variant_urls(name, request=None):
+    """
+    {variant: url} for every variant of `name` generated so far, plus the
+    original. None when there is no image.
+    """
+    if not name:
+        return None
+    storage = variant_storage()
+    urls = {"original": storage.url(name)}
+    for variant in VARIANTS:
+        target = variant_name(name, variant)
+        if _is_ready(storage, target):
+            urls[variant] = storage.url(target)
+    if request is not None:
+        urls = {key: request.build_absolute_uri(url) for key, url in urls.items()}
+    return urls
+
+
+def _render(source, size, fmt):
+    image = source.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    if fmt == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif fmt in ("PNG", "WEBP") and image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    return image
+
+
+def _write(storage, name, image, fmt):
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written to a temp file first so a half written variant is never served
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            image.save(out, fmt, **SAVE_OPTIONS[fmt])
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def generate_variants(name, force=False):
+    """
+    Writes the missing variants of one stored image, returns the names of
+    the variants that were written
+    """
+    storage = variant_storage()
+    if not name or not storage.exists(name):
+        return []
+    source_time = os.path.getmtime(storage.path(name))
+    todo = []
+    for variant, (size, fmt) in VARIANTS.items():
+        target = variant_name(name, variant)
+        fmt = fmt or ("PNG" if target.endswith(".png") else "JPEG")
+        # a re-uploaded file with the same name makes the old variants stale
+        if force or not storage.exists(target) or os.path.getmtime(storage.path(target)) < source_time:
+            todo.append((target, size, fmt))
+    if not todo:
+        return []
+
+    written = []
+    try:
+        with storage.open(name, "rb") as fh, Image.open(fh) as source:
+            source = ImageOps.exif_transpose(source)
+            source.load()
+            for target, size, fmt in todo:
+                _write(storage, target, _render(source, size, fmt), fmt)
+                _mark_ready(target)
+                written.append(target)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        logger.warning("Could not make variants of %s: %s", name, exc)
+    return written
+
+
+def delete_variants(name):
+    storage = variant_storage()
+    for variant in VARIANTS:
+        target = variant_name(name, variant)
+        with _ready_lock:
+            _ready.pop(target, None)
+        storage.delete(target)
+
+
+def _run(names):
+    for name in names:
+        try:
+            generate_variants(name)
+        except Exception:
+            logger.exception("Variant generation failed for %s", name)
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="image-variants")
+        return _executor
+
+
+def queue_variants(*names):
+    """Generates the variants in the background once the current transaction commits"""
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: _pool().submit(_run, names))
+
+
+def image_names(instance, fields, update_fields=None):
+    """Stored file names of the given image fields of a saved instance"""
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    return [getattr(instance, field).name for field in fields if getattr(instance, field)]
@@ -0,0 +1,158 @@
+"""
+Background jobs kept in the database.
+
+Request handlers queue side effects that do not change their response with
+Job.enqueue(name, payload, dedup_key=...), `manage.py run_worker` claims them
+in batches and runs the handler registered under that name with the payload
+as keyword arguments.
+
+Claiming marks a batch as running with a token unique to the claim. On
+databases with SELECT ... FOR UPDATE SKIP LOCKED (Postgres, MySQL 8) the
+candidates are locked first so workers never wait on each other, on SQLite a
+single UPDATE ... WHERE id IN (SELECT ... LIMIT n) claims them, only one
+connection writes at a time so that is enough.
+A job that fails is retried with exponential backoff until max_attempts,
+a worker that died mid job has its jobs picked up again after LOCK_TIMEOUT.
+"""
+
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AccountabilityPartner, ApplicationUser, Comment, Job, Post
+from .timers import flush_timers
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 20
+LOCK_TIMEOUT = timedelta(minutes=10)
+BACKOFF_BASE = 10
+MAX_BACKOFF = 3600
+
+handlers = {}
+
+
+def job(name):
+    """Registers a function as the handler of the jobs called `name`"""
+    def register(func):
+        handlers[name] = func
+        return func
+    return register
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(batch_size=BATCH_SIZE, worker=None):
+    """Marks up to batch_size due jobs as running for this worker and returns them"""
+    now = timezone.now()
+    token = f"{worker or worker_id()}:{uuid.uuid4().hex[:8]}"
+    due = Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_at__lt=now - LOCK_TIMEOUT)
+    candidates = Job.objects.filter(due).order_by("run_at", "id").values_list("id", flat=True)
+    claim_fields = dict(status=Job.RUNNING, locked_at=now, locked_by=token, attempts=F("attempts") + 1)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True)[:batch_size])
+            if not ids:
+                return []
+            Job.objects.filter(due, id__in=ids).update(**claim_fields)
+    else:
+        # one statement so sqlite takes the write lock straight away, reading
+        # first and upgrading to a write fails with "database is locked"
+        # whenever a request is writing
+        if not Job.objects.filter(due, id__in=candidates[:batch_size]).update(**claim_fields):
+            return []
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by("run_at", "id"))
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), MAX_BACKOFF))
+
+
+def _fail(claimed, error, retry=True):
+    mine = Job.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by)
+    if not retry or claimed.attempts >= claimed.max_attempts:
+        logger.error("Job %s %s failed for good: %s", claimed.pk, claimed.name, error)
+        mine.update(status=Job.FAILED, last_error=error)
+        return
+    logger.warning("Job %s %s failed, attempt %s: %s", claimed.pk, claimed.name, claimed.attempts, error)
+    try:
+        with transaction.atomic():
+            mine.update(
+                status=Job.QUEUED,
+                run_at=timezone.now() + backoff(claimed.attempts),
+                locked_at=None,
+                locked_by="",
+                last_error=error,
+            )
+    except IntegrityError:
+        # the same work was queued again meanwhile, that job will do it
+        mine.delete()
+
+
+def run_job(claimed):
+    """Runs one claimed job, returns True when it succeeded"""
+    handler = handlers.get(claimed.name)
+    if handler is None:
+        _fail(claimed, f"No handler registered for {claimed.name!r}", retry=False)
+        return False
+    try:
+        with transaction.atomic():
+            handler(**claimed.payload)
+    except Exception as exc:
+        _fail(claimed, "".join(traceback.format_exception_only(type(exc), exc)).strip())
+        return False
+    Job.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by).delete()
+    return True
+
+
+def run_pending(batch_size=BATCH_SIZE, worker=None):
+    """Claims and runs one batch, returns how many jobs were run"""
+    claimed = claim(batch_size, worker)
+    for item in claimed:
+        run_job(item)
+    return len(claimed)
+
+
+# -- handlers -----------------------------------------------------------
+
+@job("activate_partners")
+def activate_partners(pairs):
+    AccountabilityPartner.activate_pairs(tuple(pair) for pair in pairs)
+
+
+@job("deactivate_partners")
+def deactivate_partners(pairs):
+    AccountabilityPartner.deactivate_unused(tuple(pair) for pair in pairs)
+
+
+@job("recount_post")
+def recount_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        post.recount()
+
+
+@job("recount_comment")
+def recount_comment(comment_id):
+    comment = Comment.objects.filter(pk=comment_id).first()
+    if comment is not None:
+        comment.recount()
+
+
+@job("recount_follows")
+def recount_follows(user_ids):
+    ApplicationUser.objects.recount_follows(user_ids)
+
+
+@job("flush_work_timers")
+def flush_work_timers():
+    flush_timers()
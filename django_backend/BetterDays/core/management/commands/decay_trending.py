@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import Post
+
+
+class Command(BaseCommand):
+    help = "Re-decay the stored trending scores of posts (run periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-days",
+            type=int,
+            default=30,
+            help="Posts older than this are dropped to a score of 0 in one UPDATE.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - timedelta(days=options["max_age_days"])
+        batch_size = options["batch_size"]
+
+        # old posts have decayed to practically nothing, no need to compute them
+        expired = (
+            Post.objects.filter(post_date_created__lt=cutoff)
+            .exclude(trending_score=0)
+            .update(trending_score=0)
+        )
+
+        # walk the recent posts by id so each batch is one SELECT and one bulk UPDATE
+        recent = Post.objects.filter(post_date_created__gte=cutoff).only(
+            "id", "like_count", "comment_count", "post_date_created"
+        ).order_by("id")
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(recent.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                post.trending_score = post.compute_trending_score(now)
+            Post.objects.bulk_update(batch, ["trending_score"])
+            updated += len(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-decayed {updated} trending scores, expired {expired} old posts."
+            )
+        )
@@ -0,0 +1,102 @@
+import os
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...images import delete_variants
+from ...models import MediaBlob
+from ...signals import MEDIA_FIELDS
+from ...storage import CAS_DIR, blob_lock, is_hashed_name
+
+# blobs written by an upload whose row was never saved are only swept once
+# they are this old, so an upload still in flight is never touched
+ORPHAN_AGE = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Move uploads stored before content addressed storage into it (duplicates "
+        "become one file), recount blob references and delete unreferenced blobs."
+    )
+
+    def handle(self, *args, **options):
+        moved, missing = self.move_legacy_files()
+        counts = self.recount()
+        removed = MediaBlob.collect(
+            MediaBlob.objects.filter(ref_count__lte=0).values_list("name", flat=True)
+        )
+        removed += self.sweep_orphans(counts)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} file(s) ({missing} missing on disk), "
+            f"{len(counts)} blob(s) referenced, removed {removed} unreferenced blob(s)."
+        ))
+
+    def move_legacy_files(self):
+        hashed = {}
+        missing = 0
+        for model, fields in MEDIA_FIELDS.items():
+            for field in fields:
+                names = (
+                    model.objects.exclude(**{f"{field}__startswith": f"{CAS_DIR}/"})
+                    .exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+                    .values_list(field, flat=True).distinct()
+                )
+                for name in list(names):
+                    if name not in hashed:
+                        if not default_storage.exists(name):
+                            missing += 1
+                            continue
+                        with default_storage.open(name, "rb") as fh:
+                            hashed[name] = default_storage.save(name, fh)
+                    # the recount below fixes up the MediaBlob rows
+                    model.objects.filter(**{field: name}).update(**{field: hashed[name]})
+
+        for name in hashed:
+            default_storage.delete(name)
+            delete_variants(name)
+        return len(hashed), missing
+
+    @transaction.atomic
+    def recount(self):
+        counts = Counter()
+        for model, fields in MEDIA_FIELDS.items():
+            for field in fields:
+                rows = (
+                    model.objects.filter(**{f"{field}__startswith": f"{CAS_DIR}/"})
+                    .values_list(field, flat=True)
+                )
+                counts.update(rows.iterator())
+
+        blobs = MediaBlob.objects.in_bulk(field_name="name")
+        stale = []
+        for name, blob in blobs.items():
+            if blob.ref_count != counts.get(name, 0):
+                blob.ref_count = counts.get(name, 0)
+                stale.append(blob)
+        MediaBlob.objects.bulk_update(stale, ["ref_count"])
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name, ref_count=count) for name, count in counts.items() if name not in blobs]
+        )
+        return counts
+
+    def sweep_orphans(self, counts):
+        removed = 0
+        root = default_storage.path(CAS_DIR)
+        cutoff = time.time() - ORPHAN_AGE
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, default_storage.location).replace(os.sep, "/")
+                if not is_hashed_name(name) or name in counts or os.path.getmtime(path) > cutoff:
+                    continue
+                # an upload may have just reused it, that retains it under the lock
+                with blob_lock(default_storage, name):
+                    if MediaBlob.objects.filter(name=name, ref_count__gt=0).exists():
+                        continue
+                    os.unlink(path)
+                delete_variants(name)
+                removed += 1
+        return removed
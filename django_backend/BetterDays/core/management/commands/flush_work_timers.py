@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ...timers import flush_timers
+
+
+class Command(BaseCommand):
+    help = "Fold stopped work task timer sessions into time_spent (run periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="How many tasks are folded per UPDATE.",
+        )
+
+    def handle(self, *args, **options):
+        tasks, minutes = flush_timers(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Added {minutes} minute(s) to {tasks} task(s)."))
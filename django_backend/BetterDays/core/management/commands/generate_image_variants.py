@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from ...images import generate_variants
+from ...signals import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Generate the resized variants of images uploaded before the variant pipeline existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate variants that already exist.",
+        )
+
+    def handle(self, *args, **options):
+        images = written = 0
+        for model, fields in IMAGE_FIELDS.items():
+            for field in fields:
+                names = (
+                    model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+                    .values_list(field, flat=True).distinct().iterator()
+                )
+                for name in names:
+                    images += 1
+                    written += len(generate_variants(name, force=options["force"]))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} variant(s) for {images} image(s)."))
@@ -1,8 +1,17 @@
+import json
+import os
+
 from ...models import MoodCategory, MoodSubcategory
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+SUBCATEGORY_FIELDS = ("description", "mbti_insight")
 
 class Command(BaseCommand):
-    help = "Populate the database with mood categories and subcategories."
+    help = (
+        "Populate the database with mood categories and subcategories. "
+        "Safe to re-run, rows are matched on name and only changed ones are written."
+    )
     # moods_data.py (or a data migration script)
     moods = {
         "Happy": [
@@ -44,14 +53,96 @@ class Command(BaseCommand):
     }
 
 
-    def handle(self, *args, **kwargs):
-        for category_name, subcategories in self.moods.items():
-            category, _ = MoodCategory.objects.get_or_create(name=category_name)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            help=(
+                "Load the catalog from a JSON or YAML file instead of the built in one, "
+                'same shape: {"Category": [{"name": ..., "description": ..., "mbti_insight": ...}]}'
+            ),
+        )
+
+    def load_file(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+                    try:
+                        import yaml
+                    except ImportError:
+                        raise CommandError("PyYAML is needed for YAML files (pip install pyyaml)")
+                    return yaml.safe_load(f)
+                return json.load(f)
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        except ValueError as e:
+            raise CommandError(f"Could not parse {path}: {e}")
+
+    def validate(self, moods):
+        if not isinstance(moods, dict):
+            raise CommandError("The catalog must map category names to lists of moods")
+        seen = set()
+        for category_name, subcategories in moods.items():
+            if not isinstance(subcategories, list):
+                raise CommandError(f"{category_name}: expected a list of moods")
             for mood in subcategories:
-                MoodSubcategory.objects.get_or_create(
-                    category=category,
-                    name=mood["name"],
-                    description=mood["description"],
-                    mbti_insight=mood["mbti_insight"]
+                if not isinstance(mood, dict) or not mood.get("name"):
+                    raise CommandError(f"{category_name}: every mood needs a name")
+                missing = [field for field in SUBCATEGORY_FIELDS if field not in mood]
+                if missing:
+                    raise CommandError(f"{mood['name']}: missing {', '.join(missing)}")
+                # names are unique across categories in the table
+                if mood["name"] in seen:
+                    raise CommandError(f"{mood['name']} is listed more than once")
+                seen.add(mood["name"])
+
+    def handle(self, *args, **options):
+        moods = self.load_file(options["file"]) if options.get("file") else self.moods
+        self.validate(moods)
+
+        with transaction.atomic():
+            # categories only have a name, create whatever is missing
+            MoodCategory.objects.bulk_create(
+                [MoodCategory(name=name) for name in moods], ignore_conflicts=True
+            )
+            category_ids = dict(
+                MoodCategory.objects.filter(name__in=list(moods)).values_list("name", "id")
+            )
+
+            # diff against what is stored in one query, then upsert only what changed
+            existing = {
+                name: (category_id, description, mbti_insight)
+                for name, category_id, description, mbti_insight in MoodSubcategory.objects.values_list(
+                    "name", "category_id", "description", "mbti_insight"
                 )
-        self.stdout.write(self.style.SUCCESS("Mood categories and subcategories populated successfully!"))
\ No newline at end of file
+            }
+            changed = []
+            created = 0
+            for category_name, subcategories in moods.items():
+                for mood in subcategories:
+                    row = (category_ids[category_name], mood["description"], mood["mbti_insight"])
+                    if existing.get(mood["name"]) == row:
+                        continue
+                    created += mood["name"] not in existing
+                    changed.append(
+                        MoodSubcategory(
+                            name=mood["name"],
+                            category_id=row[0],
+                            description=row[1],
+                            mbti_insight=row[2],
+                        )
+                    )
+            if changed:
+                MoodSubcategory.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=["name"],
+                    update_fields=["category", *SUBCATEGORY_FIELDS],
+                )
+
+        total = sum(len(subcategories) for subcategories in moods.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Mood catalog up to date: {created} created, {len(changed) - created} updated, "
+                f"{total - len(changed)} unchanged."
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ...models import DailyMoodRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily mood rollups from the notes table in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="users",
+            help="Only rebuild this user id (can be given more than once).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = DailyMoodRollup.rebuild(
+            user_ids=options["users"], batch_size=options["batch_size"]
+        )
+        scope = f"{len(options['users'])} user(s)" if options["users"] else "all users"
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} mood rollup rows for {scope}."))
@@ -0,0 +1,62 @@
+import logging
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from ...jobs import BATCH_SIZE, run_pending, worker_id
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (recounts, partnership updates, timer flushes) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="How many jobs are claimed at a time.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before looking again when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run everything that is due and exit, e.g. from cron.",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        # finish the current batch on SIGTERM / ctrl-c instead of dying mid job
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker = worker_id()
+        total = 0
+        self.stdout.write(f"Worker {worker} started.")
+        while not self.stopping:
+            close_old_connections()
+            try:
+                ran = run_pending(options["batch_size"], worker)
+            except OperationalError as e:
+                # e.g. sqlite "database is locked" while the server writes,
+                # whatever was claimed is picked up again after LOCK_TIMEOUT
+                logger.warning("Worker %s could not reach the queue: %s", worker, e)
+                time.sleep(options["sleep"])
+                continue
+            total += ran
+            if not ran:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} ran {total} job(s)."))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,158 @@
+"""
+Serving uploaded media.
+
+Django only decides whether a file may be sent and with which caching
+headers, it does not push the bytes through a worker:
+
+- behind nginx (MEDIA_ACCEL_REDIRECT_PREFIX set) the response is an empty
+  X-Accel-Redirect to an internal location, nginx sends the file and
+  handles Range / If-Modified-Since itself
+- standalone the file is handed to the WSGI server as a FileResponse, which
+  gunicorn sends with sendfile(). Conditional GETs and single byte ranges are
+  answered here.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import is_hashed_name
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# anything that is not content addressed may be replaced under the same name
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def authorize_media(request, path):
+    """
+    Whether the request may read this file. Every upload is public at the
+    moment (posts, avatars, mood images), per file rules belong here.
+    """
+    return True
+
+
+def resolve_media_path(path):
+    path = posixpath.normpath(path).lstrip("/")
+    if not path or path == "." or any(part.startswith(".") for part in path.split("/")):
+        raise Http404
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    return path, fullpath
+
+
+def cache_headers(response, path):
+    response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if is_hashed_name(path) else DEFAULT_CACHE_CONTROL
+    return response
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the
+    whole file (no header, several ranges or syntax we do not handle) and
+    ValueError when the range cannot be satisfied
+    """
+    match = _RANGE_RE.match(header or "")
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range, the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class _RangeFile:
+    """
+    Read only view of `length` bytes of an open file from its current
+    position. fileno() is kept so gunicorn can still sendfile() it, the
+    Content-Length tells it where to stop.
+    """
+
+    def __init__(self, fh, length):
+        self._fh = fh
+        self._left = length
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b""
+        size = self._left if size is None or size < 0 else min(size, self._left)
+        data = self._fh.read(size)
+        self._left -= len(data)
+        return data
+
+    def fileno(self):
+        return self._fh.fileno()
+
+    def close(self):
+        self._fh.close()
+
+
+def media_view(request, path):
+    path, fullpath = resolve_media_path(path)
+    if not authorize_media(request, path):
+        raise Http404
+
+    content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+    prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+    if prefix:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(path)
+        return cache_headers(response, path)
+
+    stat = os.stat(fullpath)
+    # a hashed name already says which bytes these are
+    etag = '"%s"' % (
+        os.path.splitext(os.path.basename(path))[0] if is_hashed_name(path)
+        else "%x-%x" % (int(stat.st_mtime), stat.st_size)
+    )
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return cache_headers(not_modified, path)
+
+    size = stat.st_size
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    # If-Range: only send a part if the client still has the same file
+    if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    fh = open(fullpath, "rb")
+    if byte_range is None:
+        response = FileResponse(fh, content_type=content_type)
+    else:
+        start, end = byte_range
+        fh.seek(start)
+        response = FileResponse(_RangeFile(fh, end - start + 1), status=206, content_type=content_type)
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return cache_headers(response, path)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:05
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_trending_scores(apps, schema_editor):
+    from core.models import trending_score
+
+    Post = apps.get_model('core', 'Post')
+    now = timezone.now()
+    posts = list(Post.objects.only('id', 'like_count', 'comment_count', 'post_date_created'))
+    for post in posts:
+        post.trending_score = trending_score(
+            post.like_count, post.comment_count, post.post_date_created, now
+        )
+    Post.objects.bulk_update(posts, ['trending_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_accountabilitypartner_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ),
+        migrations.RunPython(backfill_trending_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_post_index(apps, schema_editor):
+    from core.search import post_index
+
+    post_index.create(schema_editor)
+
+
+def drop_post_index(apps, schema_editor):
+    from core.search import post_index
+
+    post_index.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_post_trending_score'),
+    ]
+
+    operations = [
+        # FTS5 table + sync triggers on SQLite, tsvector column + GIN index on Postgres
+        migrations.RunPython(create_post_index, drop_post_index),
+    ]
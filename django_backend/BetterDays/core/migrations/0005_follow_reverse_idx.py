@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', 'followers'], name='follow_reverse_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:11
+
+from django.db import migrations, models
+
+
+def fold_existing_users(apps, schema_editor):
+    ApplicationUser = apps.get_model('core', 'ApplicationUser')
+    users = list(ApplicationUser.objects.only('id', 'username', 'email'))
+    for user in users:
+        user.username_folded = user.username.casefold()
+        user.email_folded = user.email.casefold()
+    ApplicationUser.objects.bulk_update(users, ['username_folded', 'email_folded'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_follow_reverse_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='applicationuser',
+            name='email_folded',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='applicationuser',
+            name='username_folded',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(fold_existing_users, migrations.RunPython.noop),
+    ]
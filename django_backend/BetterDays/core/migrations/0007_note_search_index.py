@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def create_note_index(apps, schema_editor):
+    from core.search import note_index
+
+    note_index.create(schema_editor)
+
+
+def drop_note_index(apps, schema_editor):
+    from core.search import note_index
+
+    note_index.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_folded_search_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_note_index, drop_note_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_note_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', '-note_date_created'], name='note_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, Trunc
+
+
+def build_rollups(apps, schema_editor):
+    Note = apps.get_model('core', 'Note')
+    DailyMoodRollup = apps.get_model('core', 'DailyMoodRollup')
+    rows = (
+        Note.objects.filter(mood_subcategory__isnull=False)
+        .annotate(day=Trunc('note_date_created', 'day', output_field=models.DateField()))
+        .values_list('user_id', 'day', 'mood_subcategory_id')
+        .annotate(count=Count('id'), time_spent_sum=Coalesce(Sum('time_spent'), 0))
+        .order_by()
+    )
+    DailyMoodRollup.objects.bulk_create(
+        [
+            DailyMoodRollup(
+                user_id=user_id,
+                date=day,
+                subcategory_id=subcategory_id,
+                count=count,
+                time_spent_sum=time_spent_sum,
+            )
+            for user_id, day, subcategory_id, count, time_spent_sum in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_note_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMoodRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('time_spent_sum', models.IntegerField(default=0)),
+                ('subcategory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.moodsubcategory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date', 'subcategory'), name='unique_daily_mood_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
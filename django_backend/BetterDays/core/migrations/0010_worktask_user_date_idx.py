@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_dailymoodrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='worktask',
+            index=models.Index(fields=['user', '-date_created'], name='worktask_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_worktask_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkTaskTimerEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('start', 'Start'), ('stop', 'Stop')], max_length=5)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('flushed', models.BooleanField(default=False)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timer_events', to='core.worktask')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timer_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['at', 'id'],
+                'indexes': [models.Index(fields=['flushed', 'task', 'at'], name='timer_event_pending_idx')],
+            },
+        ),
+    ]
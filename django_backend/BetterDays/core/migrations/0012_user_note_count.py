@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_existing_notes(apps, schema_editor):
+    ApplicationUser = apps.get_model('core', 'ApplicationUser')
+    Note = apps.get_model('core', 'Note')
+    ApplicationUser.objects.update(
+        note_count=Coalesce(
+            Subquery(
+                Note.objects.filter(user=OuterRef('pk'))
+                .order_by()
+                .values('user')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            Value(0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_worktasktimerevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='applicationuser',
+            name='note_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_notes, migrations.RunPython.noop),
+    ]
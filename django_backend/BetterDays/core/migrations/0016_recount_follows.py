@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def recount_follows(apps, schema_editor):
+    # counts stored before the follow toggle fix had followers and following
+    # swapped, same recount as ApplicationUserManager.recount_follows
+    ApplicationUser = apps.get_model('core', 'ApplicationUser')
+    Follow = apps.get_model('core', 'Follow')
+
+    def count_of(field):
+        return Coalesce(
+            Subquery(
+                Follow.objects.filter(**{field: OuterRef('pk')})
+                .order_by()
+                .values(field)
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            Value(0),
+        )
+
+    ApplicationUser.objects.update(
+        followers_count=count_of('following'),
+        following_count=count_of('followers'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_follows, migrations.RunPython.noop),
+    ]
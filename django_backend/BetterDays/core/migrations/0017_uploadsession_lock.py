@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_recount_follows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='locked_by',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_uploadsession_lock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='streak_awarded_on',
+            field=models.DateField(blank=True, default=None, editable=False, null=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Trunc
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import (
@@ -7,9 +9,11 @@ from django.contrib.auth.models import (
     BaseUserManager,
 )
 from django.template.defaultfilters import slugify
+import os
 import uuid
+from collections import Counter
 from django.core.exceptions import ValidationError
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.validators import MinValueValidator
 
@@ -56,6 +60,36 @@ class CustomUserManager(BaseUserManager):
             username=username, email=email, password=password, **extra_fields
         )
 
+    def adjust_follow_counts(self, follower_id, following_id, delta):
+        # bumps both sides of a follow in place with F() so we never have to
+        # recount the whole follow table or rewrite the full user rows
+        self.filter(pk=follower_id).update(following_count=F("following_count") + delta)
+        self.filter(pk=following_id).update(followers_count=F("followers_count") + delta)
+
+    def adjust_note_count(self, user_id, delta):
+        self.filter(pk=user_id).update(note_count=F("note_count") + delta)
+
+    def recount_follows(self, user_ids=None):
+        # full recount for bulk imports / repairs, done as a single UPDATE
+        # with correlated subqueries instead of two COUNT(*) per user
+        def count_of(field):
+            return Coalesce(
+                Subquery(
+                    Follow.objects.filter(**{field: OuterRef("pk")})
+                    .order_by()
+                    .values(field)
+                    .annotate(total=Count("pk"))
+                    .values("total")
+                ),
+                Value(0),
+            )
+
+        users = self.all() if user_ids is None else self.filter(pk__in=user_ids)
+        return users.update(
+            followers_count=count_of("following"),
+            following_count=count_of("followers"),
+        )
+
 
 class AbstractCustomUser(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(max_length=150, unique=True)
@@ -108,13 +142,32 @@ class ApplicationUser(AbstractCustomUser):
     roles = models.CharField(max_length=2, choices=Role.choices, default=Role.APP_USER) 
     followers_count = models.IntegerField(default=0, editable=False)
     following_count = models.IntegerField(default=0, editable=False)
+    # kept in step by Note.save/delete with F() so achievement rules never count notes
+    note_count = models.IntegerField(default=0, editable=False)
     bio = models.TextField(blank=True, null=True, max_length=500, 
                         help_text="User's biography")
+    # case folded copies kept by save() so prefix search is an index range scan
+    username_folded = models.CharField(max_length=150, db_index=True, editable=False, default="")
+    email_folded = models.CharField(max_length=254, db_index=True, editable=False, default="")
+
+    def save(self, *args, **kwargs):
+        self.username_folded = (self.username or "").casefold()
+        self.email_folded = (self.email or "").casefold()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if "username" in update_fields:
+                update_fields.add("username_folded")
+            if "email" in update_fields:
+                update_fields.add("email_folded")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
 
     def update_follow_counts(self):
-        self.followers_count = self.followers_relation.count()
-        self.following_count = self.following_relation.count()
-        self.save()
+        # followers_relation holds the rows where this user is the follower
+        # so it feeds following_count (and the other way round)
+        ApplicationUser.objects.recount_follows([self.pk])
+        self.refresh_from_db(fields=["followers_count", "following_count"])
 
 
 class Follow(models.Model):
@@ -132,22 +185,93 @@ class Follow(models.Model):
                 fields=["followers", "following"], name="Follow_constraint"
             )
         ]
+        indexes = [
+            # mirror of Follow_constraint for "who follows X" lookups and paging
+            models.Index(fields=["following", "followers"], name="follow_reverse_idx"),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.followers == self.following:
+        if self.followers_id == self.following_id:
             raise ValidationError("A user cannot follow themselves.")
-        super().save(*args, **kwargs)
-        self.followers.update_follow_counts()
-        self.following.update_follow_counts()
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding:
+                # counted before the insert so post_save handlers see the new totals,
+                # a failed insert rolls the bump back with it
+                ApplicationUser.objects.adjust_follow_counts(
+                    self.followers_id, self.following_id, 1
+                )
+            super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
-        self.followers.update_follow_counts()
-        self.following.update_follow_counts()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ApplicationUser.objects.adjust_follow_counts(
+                self.followers_id, self.following_id, -1
+            )
+        return result
+
+    @classmethod
+    def toggle(cls, follower_id, following_id):
+        """Follow or unfollow in one transaction, returns True if now following"""
+        if follower_id == following_id:
+            raise ValidationError("A user cannot follow themselves.")
+        with transaction.atomic():
+            _, deleted = cls.objects.filter(
+                followers_id=follower_id, following_id=following_id
+            ).delete()
+            if deleted.get(cls._meta.label):
+                ApplicationUser.objects.adjust_follow_counts(follower_id, following_id, -1)
+                return False
+            # the unique constraint settles races, if another request got the
+            # row in first we are already following and the counts are done
+            try:
+                with transaction.atomic():
+                    cls.objects.create(followers_id=follower_id, following_id=following_id)
+            except IntegrityError:
+                pass
+            return True
+
+    @classmethod
+    def bulk_import(cls, pairs, batch_size=1000):
+        """Insert (follower_id, following_id) pairs, the counters are recounted once by a job"""
+        rows = [
+            cls(followers_id=follower_id, following_id=following_id)
+            for follower_id, following_id in pairs
+            if follower_id != following_id
+        ]
+        with transaction.atomic():
+            cls.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+            affected = {row.followers_id for row in rows} | {row.following_id for row in rows}
+            # the counters are fixed up by a worker, an import does not wait for it
+            Job.enqueue("recount_follows", {"user_ids": sorted(affected)})
+        # bulk_create sends no signals, the suggestion graph reloads on next use
+        from .follow_graph import follow_graph
+
+        follow_graph.mark_stale()
+        return len(rows)
 
 
 # for posts and and comments respecgtively we will make use of count and do it in a similar manner ot how follow and application user model
 # increment followers and following respecively
+
+# trending is a hacker news style score, engagement divided by age raised to a gravity
+# it is stored on the post so the trending feed is just an index scan, the recount
+# job refreshes it as counts change and the decay_trending command re-decays everything in bulk
+TRENDING_COMMENT_WEIGHT = 2
+TRENDING_GRAVITY = 1.5
+# like / comment counters move by F() inline, an exact recount (and the new
+# trending score) runs as a background job this many seconds later
+RECOUNT_DELAY = 30
+
+
+def trending_score(like_count, comment_count, created, now=None):
+    now = now or timezone.now()
+    age_hours = max((now - created).total_seconds(), 0) / 3600
+    engagement = like_count + TRENDING_COMMENT_WEIGHT * comment_count + 1
+    return engagement / (age_hours + 2) ** TRENDING_GRAVITY
+
+
 class Post(models.Model):
     user = models.ForeignKey(ApplicationUser, on_delete=models.CASCADE)
     post_title = models.CharField(max_length=128)
@@ -164,14 +288,41 @@ class Post(models.Model):
 
     like_count = models.IntegerField(default=0, editable=False)
     comment_count = models.IntegerField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)
 
-    def update_like_count(self):
-        self.like_count = self.post_likes.count()
-        self.save()
+    class Meta:
+        indexes = [
+            models.Index(fields=["-trending_score", "-id"], name="post_trending_idx"),
+        ]
 
-    def update_comment_count(self):
+    def compute_trending_score(self, now=None):
+        return trending_score(
+            self.like_count, self.comment_count, self.post_date_created, now
+        )
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.trending_score = self.compute_trending_score()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def adjust_counts(cls, post_id, likes=0, comments=0):
+        changes = {}
+        if likes:
+            changes["like_count"] = F("like_count") + likes
+        if comments:
+            changes["comment_count"] = F("comment_count") + comments
+        if changes:
+            cls.objects.filter(pk=post_id).update(**changes)
+        Job.enqueue(
+            "recount_post", {"post_id": post_id}, dedup_key=f"recount_post:{post_id}", delay=RECOUNT_DELAY
+        )
+
+    def recount(self):
+        self.like_count = self.post_likes.count()
         self.comment_count = self.comments.count()
-        self.save()
+        self.trending_score = self.compute_trending_score()
+        self.save(update_fields=["like_count", "comment_count", "trending_score"])
 
 
 # we need to create a unary relationship for comment
@@ -194,18 +345,32 @@ class Comment(models.Model):
 
     like_count = models.IntegerField(default=0, editable=False)
 
-    def update_like_count(self):
+    @classmethod
+    def adjust_like_count(cls, comment_id, delta):
+        if delta:
+            cls.objects.filter(pk=comment_id).update(like_count=F("like_count") + delta)
+        Job.enqueue(
+            "recount_comment", {"comment_id": comment_id}, dedup_key=f"recount_comment:{comment_id}", delay=RECOUNT_DELAY
+        )
+
+    def recount(self):
         self.like_count = self.comment_likes.count()
-        self.save()
+        self.save(update_fields=["like_count"])
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.post.update_comment_count()
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Post.adjust_counts(self.post_id, comments=1)
 
     def delete(self, *args, **kwargs):
-        post = self.post
-        super().delete(*args, **kwargs)
-        post.update_comment_count()
+        # replies deleted along with it are picked up by the recount job
+        post_id = self.post_id
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Post.adjust_counts(post_id, comments=-1)
+        return result
 
 # for both functions below for likes we need to create logic such that if they try to like again they will not be able to
 # we also need to enable likes not being able to happen
@@ -223,18 +388,21 @@ class PostLike(models.Model):
     def save(self, *args, **kwargs):
         # Check if the user has already liked the post
         existing_like = PostLike.objects.filter(user=self.user, post=self.post)
-        if existing_like.exists():
-            # If the like already exists, delete it (toggle off)
-            existing_like.delete()
-        else:
-            # If the like doesn't exist, save it (toggle on)
-            super().save(*args, **kwargs)
-        self.post.update_like_count()
+        with transaction.atomic():
+            if existing_like.exists():
+                # If the like already exists, delete it (toggle off)
+                delta = -existing_like.delete()[0]
+            else:
+                # If the like doesn't exist, save it (toggle on)
+                super().save(*args, **kwargs)
+                delta = 1
+            Post.adjust_counts(self.post_id, likes=delta)
 
     def delete(self, *args, **kwargs):
-        post = self.post
-        super().delete(*args, **kwargs)
-        post.update_like_count()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Post.adjust_counts(self.post_id, likes=-1)
+        return result
 
 
 
@@ -247,18 +415,40 @@ class CommentLike(models.Model):
     def save(self, *args, **kwargs):
         # Check if the user has already liked the comment
         existing_like = CommentLike.objects.filter(user=self.user, comment=self.comment)
-        if existing_like.exists():
-            # If the like already exists, delete it (toggle off)
-            existing_like.delete()
-        else:
-            # If the like doesn't exist, save it (toggle on)
-            super().save(*args, **kwargs)
-        self.comment.update_like_count()
+        with transaction.atomic():
+            if existing_like.exists():
+                # If the like already exists, delete it (toggle off)
+                delta = -existing_like.delete()[0]
+            else:
+                # If the like doesn't exist, save it (toggle on)
+                super().save(*args, **kwargs)
+                delta = 1
+            Comment.adjust_like_count(self.comment_id, delta)
 
     def delete(self, *args, **kwargs):
-        comment = self.comment
-        super().delete(*args, **kwargs)
-        comment.update_like_count()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Comment.adjust_like_count(self.comment_id, -1)
+        return result
+
+
+def with_viewer_state(queryset, user, like_model, like_field):
+    """
+    Adds liked_by_me / author_followed_by_me to every row as EXISTS subqueries
+    so a whole page is answered by the one SELECT instead of a query per row
+    """
+    if not user or not user.is_authenticated:
+        return queryset.annotate(
+            liked_by_me=Value(False), author_followed_by_me=Value(False)
+        )
+    return queryset.annotate(
+        liked_by_me=Exists(
+            like_model.objects.filter(user=user, **{like_field: OuterRef("pk")})
+        ),
+        author_followed_by_me=Exists(
+            Follow.objects.filter(followers=user, following=OuterRef("user"))
+        ),
+    )
 
 
 # this is not a user facing role
@@ -299,6 +489,49 @@ class AccountabilityPartner(models.Model):
             )
         ]
 
+    @staticmethod
+    def pair_filter(pairs, user_field="user_id", partner_field="partner_id"):
+        match = models.Q(pk__in=[])
+        for user_id, partner_id in pairs:
+            match |= models.Q(**{user_field: user_id, partner_field: partner_id})
+        return match
+
+    @classmethod
+    def activate_pairs(cls, pairs):
+        """
+        Every (user, partner) pair gets an active partnership, creating the
+        missing ones. Run by the activate_partners job Note.save queues
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return
+        rows = cls.objects.filter(cls.pair_filter(pairs))
+        existing = set(rows.values_list("user_id", "partner_id"))
+        rows.filter(is_active=False).update(is_active=True)
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, partner_id=partner_id) for user_id, partner_id in pairs - existing]
+        )
+
+    @classmethod
+    def deactivate_unused(cls, pairs):
+        """
+        Pairs that no note or habit points at any more are made inactive, run
+        by the deactivate_partners job Note.delete queues
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return
+        still_used = set(
+            Note.objects.filter(cls.pair_filter(pairs, "user_id", "accountability_partner_id"))
+            .values_list("user_id", "accountability_partner_id")
+        ) | set(
+            Habit.objects.filter(cls.pair_filter(pairs, "user_id", "accountability_partner_id"))
+            .values_list("user_id", "accountability_partner_id")
+        )
+        unused = pairs - still_used
+        if unused:
+            cls.objects.filter(cls.pair_filter(unused)).update(is_active=False)
+
     # this will be reconfigured in views or serializers but will be necessary at a later time
     # logic is somewhat sound but shouldnt be in the models.py
     # def save(self, *args, **kwargs):
@@ -368,40 +601,266 @@ class Note(models.Model):
     )
     Habit = models.ForeignKey("Habit", on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # journal lists and date windows are always "this user, newest first"
+            models.Index(fields=["user", "-note_date_created"], name="note_user_date_idx"),
+        ]
+
+    # columns that decide which DailyMoodRollup row a note is counted in
+    ROLLUP_FIELDS = ("user_id", "note_date_created", "mood_subcategory_id", "time_spent")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        note = super().from_db(db, field_names, values)
+        # remember what the note was counted as so save() can move it, skipped
+        # for only()/defer() loads so this never triggers extra queries
+        if all(name in field_names for name in cls.ROLLUP_FIELDS):
+            note._rollup_state = note.rollup_state()
+        return note
+
+    def rollup_state(self):
+        """(user_id, day, subcategory_id, time_spent) or None when not counted"""
+        if not self.mood_subcategory_id or not self.note_date_created:
+            return None
+        return (
+            self.user_id,
+            timezone.localdate(self.note_date_created),
+            self.mood_subcategory_id,
+            self.time_spent or 0,
+        )
+
+    def _stored_rollup_state(self):
+        state = getattr(self, "_rollup_state", False)
+        if state is not False:
+            return state
+        stored = Note.objects.filter(pk=self.pk).only(*self.ROLLUP_FIELDS).first()
+        return stored.rollup_state() if stored else None
+
     def save(self, *args, **kwargs):
         # Check that the user is not setting themselves as the accountability partner
         # i did it this way because when setting it up in the accountability partner
         # we sont want things to fail if they are we simply want them to get a help message that says that they cant do that
         # this applies to both note and habits
-        if self.accountability_partner == self.user:
+        if self.accountability_partner_id is not None and self.accountability_partner_id == self.user_id:
             raise ValidationError("A user cannot be their own accountability partner.")
-        if self.accountability_partner:
-            existing_partnership, created = AccountabilityPartner.objects.get_or_create(
-                user=self.user, partner=self.accountability_partner
-            )
-            if not existing_partnership.is_active:
-                existing_partnership.is_active = True
-                existing_partnership.save()
 
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        track_rollup = update_fields is None or any(
+            field in update_fields
+            for field in ("user", "note_date_created", "mood_subcategory", "time_spent")
+        )
+        # a save that does not write the partner column cannot change the partnership
+        partner_written = self._state.adding or update_fields is None or any(
+            field in update_fields for field in ("accountability_partner", "accountability_partner_id")
+        )
+        with transaction.atomic():
+            old_state = None if self._state.adding else self._stored_rollup_state()
+            if self._state.adding:
+                # bumped before the insert so the post_save achievement check sees it
+                ApplicationUser.objects.adjust_note_count(self.user_id, 1)
+            super().save(*args, **kwargs)
+            if track_rollup:
+                new_state = self.rollup_state()
+                DailyMoodRollup.apply_change(old_state, new_state)
+                self._rollup_state = new_state
+            if partner_written and self.accountability_partner_id:
+                # the partnership row is not needed to answer this request,
+                # a worker creates / reactivates it
+                self.queue_partner_job(
+                    "activate_partners", [(self.user_id, self.accountability_partner_id)]
+                )
 
     def delete(self, *args, **kwargs):
-        accountability_partner = self.accountability_partner
-        super().delete(*args, **kwargs)
+        partner_id = self.accountability_partner_id
+        with transaction.atomic():
+            old_state = self._stored_rollup_state()
+            result = super().delete(*args, **kwargs)
+            DailyMoodRollup.apply_change(old_state, None)
+            ApplicationUser.objects.adjust_note_count(self.user_id, -1)
+            # whether the partner is still referenced is checked by a worker
+            if partner_id:
+                self.queue_partner_job("deactivate_partners", [(self.user_id, partner_id)])
+        return result
+
+    @staticmethod
+    def queue_partner_job(name, pairs):
+        """One job per (user, partner) pair, repeats of a queued pair are dropped"""
+        for user_id, partner_id in set(pairs):
+            Job.enqueue(
+                name, {"pairs": [[user_id, partner_id]]}, dedup_key=f"{name}:{user_id}:{partner_id}"
+            )
 
-        # Check if the accountability partner is still referenced
-        if accountability_partner:
-            remaining_habits = Habit.objects.filter(
-                user=self.user, accountability_partner=accountability_partner
-            ).exists()
-            remaining_notes = Note.objects.filter(
-                user=self.user, accountability_partner=accountability_partner
-            ).exists()
+    # bulk versions of save/delete, same side effects but a handful of queries
+    # for the whole batch, callers wrap them in a transaction
 
-            if not remaining_habits and not remaining_notes:
-                AccountabilityPartner.objects.filter(
-                    user=self.user, partner=accountability_partner
-                ).update(is_active=False)
+    @staticmethod
+    def _check_partners(notes):
+        if any(n.accountability_partner_id and n.accountability_partner_id == n.user_id for n in notes):
+            raise ValidationError("A user cannot be their own accountability partner.")
+
+    @staticmethod
+    def _partner_pairs(notes):
+        return {(n.user_id, n.accountability_partner_id) for n in notes if n.accountability_partner_id}
+
+    @classmethod
+    def bulk_create_notes(cls, notes, batch_size=500):
+        cls._check_partners(notes)
+        notes = cls.objects.bulk_create(notes, batch_size=batch_size)
+        for user_id, count in Counter(note.user_id for note in notes).items():
+            ApplicationUser.objects.adjust_note_count(user_id, count)
+        deltas = {}
+        for note in notes:
+            note._rollup_state = note.rollup_state()
+            DailyMoodRollup.add_delta(deltas, note._rollup_state, 1)
+        DailyMoodRollup.bump_many(deltas)
+        cls.queue_partner_job("activate_partners", cls._partner_pairs(notes))
+        return notes
+
+    @classmethod
+    def bulk_update_notes(cls, notes, fields, old_states, batch_size=500):
+        """old_states are the rollup states from before the changes, lined up with notes"""
+        cls._check_partners(notes)
+        cls.objects.bulk_update(notes, fields, batch_size=batch_size)
+        deltas = {}
+        for note, old_state in zip(notes, old_states):
+            note._rollup_state = note.rollup_state()
+            DailyMoodRollup.add_delta(deltas, old_state, -1)
+            DailyMoodRollup.add_delta(deltas, note._rollup_state, 1)
+        DailyMoodRollup.bump_many(deltas)
+        if "accountability_partner" in fields:
+            cls.queue_partner_job("activate_partners", cls._partner_pairs(notes))
+        return notes
+
+    @classmethod
+    def bulk_delete_notes(cls, notes):
+        deltas = {}
+        for note in notes:
+            DailyMoodRollup.add_delta(deltas, note._stored_rollup_state(), -1)
+        cls.objects.filter(pk__in=[n.pk for n in notes]).delete()
+        DailyMoodRollup.bump_many(deltas)
+        for user_id, count in Counter(note.user_id for note in notes).items():
+            ApplicationUser.objects.adjust_note_count(user_id, -count)
+        cls.queue_partner_job("deactivate_partners", cls._partner_pairs(notes))
+
+
+class DailyMoodRollup(models.Model):
+    """
+    Pre aggregated mood counts per user, day and subcategory. Note.save and
+    Note.delete keep it up to date with upserts, rebuild_mood_rollups
+    recomputes it from scratch. Long range mood charts read these rows
+    instead of aggregating every note.
+    """
+
+    user = models.ForeignKey(
+        ApplicationUser, on_delete=models.CASCADE, related_name="mood_rollups"
+    )
+    date = models.DateField()
+    subcategory = models.ForeignKey(MoodSubcategory, on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+    time_spent_sum = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "date", "subcategory"], name="unique_daily_mood_rollup"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.date} {self.subcategory_id}: {self.count}"
+
+    @classmethod
+    def rebuild(cls, user_ids=None, batch_size=1000):
+        """
+        Recomputes the rollups from the notes with one GROUP BY, for everyone
+        or just the given users. Returns the number of rows written.
+        """
+        notes = Note.objects.filter(mood_subcategory__isnull=False)
+        rollups = cls.objects.all()
+        if user_ids is not None:
+            notes = notes.filter(user_id__in=user_ids)
+            rollups = rollups.filter(user_id__in=user_ids)
+        rows = (
+            notes.annotate(day=Trunc("note_date_created", "day", output_field=models.DateField()))
+            .values_list("user_id", "day", "mood_subcategory_id")
+            .annotate(count=Count("id"), time_spent_sum=Coalesce(Sum("time_spent"), 0))
+            .order_by()
+        )
+        with transaction.atomic():
+            rollups.delete()
+            created = cls.objects.bulk_create(
+                (
+                    cls(
+                        user_id=user_id,
+                        date=day,
+                        subcategory_id=subcategory_id,
+                        count=count,
+                        time_spent_sum=time_spent_sum,
+                    )
+                    for user_id, day, subcategory_id, count, time_spent_sum in rows.iterator()
+                ),
+                batch_size=batch_size,
+            )
+        return len(created)
+
+    @classmethod
+    def apply_change(cls, old_state, new_state):
+        """Moves one note from the old rollup state to the new one"""
+        deltas = {}
+        cls.add_delta(deltas, old_state, -1)
+        cls.add_delta(deltas, new_state, 1)
+        cls.bump_many(deltas)
+
+    @staticmethod
+    def add_delta(deltas, state, sign):
+        if state is None:
+            return
+        user_id, day, subcategory_id, time_spent = state
+        count, time_sum = deltas.get((user_id, day, subcategory_id), (0, 0))
+        deltas[(user_id, day, subcategory_id)] = (count + sign, time_sum + sign * time_spent)
+
+    @classmethod
+    def bump_many(cls, deltas):
+        """
+        deltas maps (user_id, day, subcategory_id) to (count, time_spent)
+        increments, applied as atomic upserts so concurrent notes never lose counts
+        """
+        deltas = {key: value for key, value in deltas.items() if value != (0, 0)}
+        if not deltas:
+            return
+        if connection.vendor in ("sqlite", "postgresql"):
+            ops = connection.ops
+            table = ops.quote_name(cls._meta.db_table)
+            count_col, time_col = ops.quote_name("count"), ops.quote_name("time_spent_sum")
+            sql = (
+                f"INSERT INTO {table} (user_id, {ops.quote_name('date')}, subcategory_id, "
+                f"{count_col}, {time_col}) VALUES (%s, %s, %s, %s, %s) "
+                f"ON CONFLICT (user_id, {ops.quote_name('date')}, subcategory_id) DO UPDATE SET "
+                f"{count_col} = {table}.{count_col} + excluded.{count_col}, "
+                f"{time_col} = {table}.{time_col} + excluded.{time_col}"
+            )
+            rows = [
+                (user_id, ops.adapt_datefield_value(day), subcategory_id, count, time_sum)
+                for (user_id, day, subcategory_id), (count, time_sum) in deltas.items()
+            ]
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+            return
+
+        for (user_id, day, subcategory_id), (count, time_sum) in deltas.items():
+            lookup = {"user_id": user_id, "date": day, "subcategory_id": subcategory_id}
+            increment = {
+                "count": F("count") + count,
+                "time_spent_sum": F("time_spent_sum") + time_sum,
+            }
+            if cls.objects.filter(**lookup).update(**increment):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(count=count, time_spent_sum=time_sum, **lookup)
+            except IntegrityError:
+                cls.objects.filter(**lookup).update(**increment)
 
 
 class Habit(models.Model):
@@ -459,6 +918,10 @@ class Habit(models.Model):
         default=None,
         help_text="Most recent completion date"
     )
+
+    # last_completed when the streak achievement was last awarded, a run that
+    # started before this has already earned it
+    streak_awarded_on = models.DateField(null=True, blank=True, default=None, editable=False)
     
     # Metadata
     created_at = models.DateTimeField(
@@ -577,6 +1040,27 @@ class Habit(models.Model):
             self.streak_count = 0
             self.last_completed = None
 
+    def streak_started_on(self):
+        """
+        Earliest day the current streak can have started, every counted
+        window is habit_frequency days long. None without a streak.
+        """
+        if not self.streak_count or not self.last_completed:
+            return None
+        return self.last_completed - timedelta(days=self.streak_count * self.habit_frequency)
+
+    def streak_already_awarded(self):
+        started = self.streak_started_on()
+        return bool(self.streak_awarded_on and started and started <= self.streak_awarded_on)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        habit = super().from_db(db, field_names, values)
+        # streak as stored, the achievement rules fire when a save crosses a threshold
+        if "streak_count" in field_names:
+            habit._saved_streak = habit.streak_count
+        return habit
+
     def mark_completed(self, date=None, completed=True, save=True):
         """Mark habit as completed/uncompleted for a specific date"""
         date = date or timezone.now().date()
@@ -586,6 +1070,7 @@ class Habit(models.Model):
             self.completions[date_str] = True
         elif date_str in self.completions:
             del self.completions[date_str]
+        self.update_streak()
 
         if save:
             self.save()
@@ -646,15 +1131,38 @@ class Achievement(models.Model):
     # for other fields that may be upadated will have their own function that does this
     # then will be subsequently added to the save function
     def save(self, *args, **kwargs):
-        existing_achievement = Achievement.objects.filter(
-            user=self.user, achievement_type=self.achievement_type
-        ).first()
-        if existing_achievement:
-            existing_achievement.ach_count += 1
-            existing_achievement.ach_date_earned = timezone.now()
-            existing_achievement.save()
-        else:
+        if not self._state.adding:
             super().save(*args, **kwargs)
+            return
+        # earning an achievement again bumps the count on the existing row in
+        # the database, no read then write so concurrent awards are never lost
+        if self._bump_existing():
+            return
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError:
+            # the row was created by someone else in the meantime
+            if not self._bump_existing():
+                raise
+
+    def _bump_existing(self):
+        rows = Achievement.objects.filter(
+            user_id=self.user_id, achievement_type_id=self.achievement_type_id
+        )
+        if not rows.update(ach_count=F("ach_count") + 1, ach_date_earned=timezone.now()):
+            return False
+        self.pk, self.ach_count, self.ach_date_earned = rows.values_list(
+            "pk", "ach_count", "ach_date_earned"
+        ).get()
+        self._state.adding = False
+        return True
+
+    @classmethod
+    def award(cls, user_id, achievement_type_id):
+        achievement = cls(user_id=user_id, achievement_type_id=achievement_type_id, ach_count=1)
+        achievement.save()
+        return achievement
 
 
 # we will need to add some constraints for this model
@@ -707,6 +1215,220 @@ class WorkTask(models.Model):
     
     class Meta:
         ordering = ['-date_created']
+        indexes = [
+            # task lists and the stats window are "this user, by date"
+            models.Index(fields=["user", "-date_created"], name="worktask_user_date_idx"),
+        ]
         
     def __str__(self):
-        return f"{self.task_name} ({self.user.username})"
\ No newline at end of file
+        return f"{self.task_name} ({self.user.username})"
+
+class WorkTaskTimerEvent(models.Model):
+    """
+    Append only log of timer starts and stops. The timer endpoints only ever
+    insert here, flush_work_timers folds the closed sessions into
+    WorkTask.time_spent in batches and marks the events as flushed.
+    """
+
+    START = "start"
+    STOP = "stop"
+    KIND_CHOICES = (
+        (START, "Start"),
+        (STOP, "Stop"),
+    )
+
+    task = models.ForeignKey(WorkTask, on_delete=models.CASCADE, related_name="timer_events")
+    user = models.ForeignKey(ApplicationUser, on_delete=models.CASCADE, related_name="timer_events")
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    at = models.DateTimeField(default=timezone.now)
+    flushed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["at", "id"]
+        indexes = [
+            models.Index(fields=["flushed", "task", "at"], name="timer_event_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.task_id} at {self.at}"
+
+
+class MediaBlob(models.Model):
+    """
+    Reference count of one content addressed upload (see storage.py). Saving
+    a file retains its blob, the image field signals retain it when a row
+    starts pointing at an existing name and
+    release it when the row is deleted or points somewhere else, the file is
+    deleted once nothing references it any more. Bulk writes send no signals
+    and must call signals.count_bulk_media_references, counts that drift
+    anyway are only repaired by `manage.py dedupe_media`.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+    @classmethod
+    def retain(cls, name, count=1):
+        if cls.objects.filter(name=name).update(ref_count=F("ref_count") + count):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, ref_count=count)
+        except IntegrityError:
+            cls.objects.filter(name=name).update(ref_count=F("ref_count") + count)
+
+    @classmethod
+    def release(cls, name, count=1):
+        cls.objects.filter(name=name).update(ref_count=F("ref_count") - count)
+        # checked again after commit, something may have retained it meanwhile
+        transaction.on_commit(lambda: cls.collect([name]))
+
+    @classmethod
+    def collect(cls, names):
+        """Deletes the blobs (and their variants) out of names that nothing references"""
+        from django.core.files.storage import default_storage
+        from .images import delete_variants
+        from .storage import blob_lock
+
+        removed = 0
+        for name in names:
+            # the conditional delete decides who removes the file, the lock
+            # keeps a save reusing this blob from slipping in between
+            with blob_lock(default_storage, name):
+                if cls.objects.filter(name=name, ref_count__lte=0).delete()[0]:
+                    default_storage.delete(name)
+                    delete_variants(name)
+                    removed += 1
+        return removed
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def upload_expiry():
+    return timezone.now() + timedelta(hours=24)
+
+
+class UploadSession(models.Model):
+    """
+    One resumable chunked upload (see uploads.py). The bytes received so far
+    live in a .part file outside MEDIA_ROOT, offset is how many of them are
+    confirmed. Finalizing moves the file into the target model's image field.
+    """
+
+    TARGET_CHOICES = (
+        ("post", "Post image"),
+        ("comment", "Comment image"),
+        ("note", "Note image"),
+        ("profile", "Profile image"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(ApplicationUser, on_delete=models.CASCADE, related_name="upload_sessions")
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    object_id = models.BigIntegerField()
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # set while a chunk is being written, see uploads.write_chunk
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=32, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=upload_expiry, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} {self.offset}/{self.size} ({self.user_id})"
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{self.pk.hex}.part")
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def delete(self, *args, **kwargs):
+        path = self.part_path
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: _remove_file(path))
+        return result
+
+    @classmethod
+    def purge_expired(cls):
+        expired = cls.objects.filter(expires_at__lt=timezone.now())
+        for session in expired.iterator():
+            session.delete()
+
+
+class Job(models.Model):
+    """
+    Background job stored in the database, run by `manage.py run_worker`
+    (see jobs.py). Jobs are deleted once they succeed, the ones that ran out
+    of attempts stay behind as failed with their last error.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (FAILED, "Failed"),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # at most one queued job per key, enqueueing the same work again is a no-op
+    dedup_key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="job_claim_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=models.Q(status="queued"),
+                name="unique_queued_job",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, {self.attempts}/{self.max_attempts})"
+
+    @classmethod
+    def enqueue(cls, name, payload=None, dedup_key=None, delay=0, max_attempts=5):
+        """
+        Queues a job, inside the caller's transaction so it only becomes
+        visible to workers if that commits. Nothing is added when a queued
+        job with the same dedup_key already exists.
+        """
+        cls.objects.bulk_create(
+            [
+                cls(
+                    name=name,
+                    payload=payload or {},
+                    dedup_key=dedup_key,
+                    max_attempts=max_attempts,
+                    run_at=timezone.now() + timedelta(seconds=delay),
+                )
+            ],
+            ignore_conflicts=True,
+        )
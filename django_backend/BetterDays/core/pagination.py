@@ -0,0 +1,40 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination that only kicks in when the client asks for it
+    with ?cursor= or ?page_size=, so the older screens that expect a plain list
+    keep working while new ones can page through large lists
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class JournalPagination(CursorPagination):
+    """Newest first keyset pages for journal style lists"""
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-note_date_created", "-id")
+
+
+class OptionalNotePagination(OptionalCursorPagination):
+    ordering = ("-note_date_created", "-id")
+
+
+class OptionalWorkNotePagination(OptionalCursorPagination):
+    ordering = ("-date_created", "-id")
@@ -0,0 +1,293 @@
+"""
+Server side full text search.
+
+On SQLite every searchable model gets an external content FTS5 table that is
+kept in sync with triggers, on Postgres a generated tsvector column with a GIN
+index is used instead. Anything else falls back to icontains filtering so the
+endpoints still work (just slowly).
+
+Results come back ranked best first and are paged with an opaque cursor that
+holds the (score, id) of the last hit, so the next page is a keyset read and
+not an OFFSET over every match.
+"""
+
+import base64
+import json
+import re
+from html import escape
+
+from django.db import connection
+
+# snippets are highlighted with control characters first so the text around
+# them can be html escaped safely before the markers become <mark> tags
+_HL_START = "\x02"
+_HL_END = "\x03"
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(score, pk):
+    raw = json.dumps([score, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        score, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def search_terms(query):
+    return _TERM_RE.findall(query or "")
+
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return (
+        escape(snippet)
+        .replace(_HL_START, "<mark>")
+        .replace(_HL_END, "</mark>")
+    )
+
+
+class FullTextIndex:
+    """
+    Describes the full text index for one model, columns are listed in the
+    order they are stored and weights rank title style columns higher
+    """
+
+    def __init__(self, source_table, columns, weights, config="english"):
+        self.source_table = source_table
+        self.fts_table = f"{source_table}_fts"
+        self.columns = list(columns)
+        self.weights = list(weights)
+        self.config = config
+
+    # -- schema, used from migrations -----------------------------------
+
+    def create(self, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == "sqlite":
+            for sql in self._sqlite_create_sql():
+                schema_editor.execute(sql)
+        elif vendor == "postgresql":
+            for sql in self._postgres_create_sql():
+                schema_editor.execute(sql)
+
+    def drop(self, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == "sqlite":
+            for action in ("ai", "ad", "au"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {self.fts_table}_{action}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {self.fts_table}")
+        elif vendor == "postgresql":
+            schema_editor.execute(f"DROP INDEX IF EXISTS {self.source_table}_search_idx")
+            schema_editor.execute(
+                f"ALTER TABLE {self.source_table} DROP COLUMN IF EXISTS search_vector"
+            )
+
+    def _sqlite_create_sql(self):
+        cols = ", ".join(self.columns)
+        new_cols = ", ".join(f"new.{c}" for c in self.columns)
+        old_cols = ", ".join(f"old.{c}" for c in self.columns)
+        fts = self.fts_table
+        return [
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{self.source_table}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {self.source_table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {self.source_table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {self.source_table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+            # index whatever rows already exist
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+
+    def _postgres_create_sql(self):
+        letters = "ABCD"
+        vector = " || ".join(
+            f"setweight(to_tsvector('{self.config}', coalesce({col}, '')), '{letters[i]}')"
+            for i, col in enumerate(self.columns)
+        )
+        return [
+            f"ALTER TABLE {self.source_table} ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS ({vector}) STORED",
+            f"CREATE INDEX {self.source_table}_search_idx ON {self.source_table} "
+            f"USING GIN (search_vector)",
+        ]
+
+    # -- querying -------------------------------------------------------
+
+    def search(self, query, where=None, cursor=None, limit=20):
+        """
+        Returns (hits, next_cursor) where hits is a list of
+        (id, score, {column: highlighted snippet}) in rank order.
+
+        where is a list of (sql, params) conditions on the source table
+        aliased as src, e.g. ("src.user_id = %s", [user.id])
+        """
+        terms = search_terms(query)
+        if not terms:
+            return [], None
+        where = where or []
+        after = decode_cursor(cursor) if cursor else None
+
+        vendor = connection.vendor
+        if vendor == "sqlite":
+            page = self._sqlite_page(terms, where, after, limit + 1)
+        elif vendor == "postgresql":
+            page = self._postgres_page(terms, where, after, limit + 1)
+        else:
+            return self._fallback(terms, where, after, limit)
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        if not page:
+            return [], None
+
+        # snippets only for the rows on this page, not for every match
+        snippets = self._snippets(vendor, terms, [pk for pk, _ in page])
+        hits = [(pk, score, snippets.get(pk, {})) for pk, score in page]
+        next_cursor = encode_cursor(page[-1][1], page[-1][0]) if has_more else None
+        return hits, next_cursor
+
+    @staticmethod
+    def _where_sql(where):
+        clauses, params = [], []
+        for sql, sql_params in where:
+            clauses.append(sql)
+            params.extend(sql_params)
+        return "".join(f" AND {c}" for c in clauses), params
+
+    @staticmethod
+    def _after_sql(after):
+        if after is None:
+            return "", []
+        return (
+            "WHERE hit_score > %s OR (hit_score = %s AND id > %s) ",
+            [after[0], after[0], after[1]],
+        )
+
+    def _sqlite_match(self, terms):
+        # every term quoted so user input can never be read as fts syntax,
+        # the last one is a prefix so search-as-you-type works
+        quoted = ['"%s"' % t.replace('"', '""') for t in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def _sqlite_page(self, terms, where, after, limit):
+        fts = self.fts_table
+        weights = ", ".join(str(float(w)) for w in self.weights)
+        extra, params = self._where_sql(where)
+        after_sql, after_params = self._after_sql(after)
+        sql = (
+            f"SELECT id, hit_score FROM ("
+            f"SELECT src.id AS id, bm25({fts}, {weights}) AS hit_score "
+            f"FROM {fts} JOIN {self.source_table} src ON src.id = {fts}.rowid "
+            f"WHERE {fts} MATCH %s{extra}) hits {after_sql}"
+            f"ORDER BY hit_score, id LIMIT %s"
+        )
+        with connection.cursor() as cur:
+            cur.execute(sql, [self._sqlite_match(terms), *params, *after_params, limit])
+            return [(row[0], row[1]) for row in cur.fetchall()]
+
+    def _postgres_tsquery(self, terms):
+        return " & ".join(f"{t}:*" for t in terms)
+
+    def _postgres_page(self, terms, where, after, limit):
+        extra, params = self._where_sql(where)
+        after_sql, after_params = self._after_sql(after)
+        # ts_rank_cd is "higher is better", negate it so both backends sort ascending
+        sql = (
+            f"SELECT id, hit_score FROM ("
+            f"SELECT src.id AS id, -ts_rank_cd(src.search_vector, q)::float8 AS hit_score "
+            f"FROM {self.source_table} src, to_tsquery(%s, %s) q "
+            f"WHERE src.search_vector @@ q{extra}) hits {after_sql}"
+            f"ORDER BY hit_score, id LIMIT %s"
+        )
+        with connection.cursor() as cur:
+            cur.execute(
+                sql,
+                [self.config, self._postgres_tsquery(terms), *params, *after_params, limit],
+            )
+            return [(row[0], row[1]) for row in cur.fetchall()]
+
+    def _snippets(self, vendor, terms, ids):
+        placeholders = ", ".join(["%s"] * len(ids))
+        if vendor == "sqlite":
+            fts = self.fts_table
+            cols = ", ".join(
+                f"snippet({fts}, {i}, '{_HL_START}', '{_HL_END}', '…', 16)"
+                for i in range(len(self.columns))
+            )
+            sql = (
+                f"SELECT rowid, {cols} FROM {fts} "
+                f"WHERE {fts} MATCH %s AND rowid IN ({placeholders})"
+            )
+            params = [self._sqlite_match(terms), *ids]
+        else:
+            options = f"StartSel={_HL_START}, StopSel={_HL_END}, MaxFragments=2"
+            cols = ", ".join(
+                f"ts_headline(%s, coalesce({col}, ''), q, %s)" for col in self.columns
+            )
+            sql = (
+                f"SELECT id, {cols} FROM {self.source_table}, to_tsquery(%s, %s) q "
+                f"WHERE id IN ({placeholders})"
+            )
+            params = [
+                *[p for _ in self.columns for p in (self.config, options)],
+                self.config,
+                self._postgres_tsquery(terms),
+                *ids,
+            ]
+        with connection.cursor() as cur:
+            cur.execute(sql, params)
+            return {
+                row[0]: {
+                    col: highlight(value) for col, value in zip(self.columns, row[1:])
+                }
+                for row in cur.fetchall()
+            }
+
+    def _fallback(self, terms, where, after, limit):
+        # no fts on this backend, match every term against any column and
+        # page by id, there is no ranking here
+        clauses, params = [], []
+        for term in terms:
+            clauses.append(
+                "(" + " OR ".join(f"LOWER(src.{c}) LIKE %s" for c in self.columns) + ")"
+            )
+            params.extend([f"%{term.lower()}%"] * len(self.columns))
+        for sql, sql_params in where:
+            clauses.append(sql)
+            params.extend(sql_params)
+        if after is not None:
+            clauses.append("src.id > %s")
+            params.append(after[1])
+        sql = (
+            f"SELECT src.id FROM {self.source_table} src WHERE {' AND '.join(clauses)} "
+            f"ORDER BY src.id LIMIT %s"
+        )
+        with connection.cursor() as cur:
+            cur.execute(sql, [*params, limit + 1])
+            ids = [row[0] for row in cur.fetchall()]
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        hits = [(pk, 0.0, {}) for pk in ids]
+        return hits, (encode_cursor(0.0, ids[-1]) if has_more else None)
+
+
+post_index = FullTextIndex(
+    "core_post", ["post_title", "post_description"], weights=[10, 1]
+)
+note_index = FullTextIndex(
+    "core_note", ["note_caption", "note_content"], weights=[5, 1]
+)
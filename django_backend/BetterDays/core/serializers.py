@@ -1,31 +1,89 @@
 from django.urls import reverse
 from rest_framework import serializers
-from django.utils import timezone
-from .models import ApplicationUser, Follow, Post, Comment, PostLike, CommentLike, AccountabilityPartner, MoodCategory, MoodSubcategory, Note, Habit, Achievement, AchievementType, WorkNote, WorkTask
+from .models import ApplicationUser, Follow, Post, Comment, PostLike, CommentLike, AccountabilityPartner, MoodCategory, MoodSubcategory, Note, Habit, Achievement, AchievementType, WorkNote, WorkTask, with_viewer_state
 from datetime import datetime
+from .cards import get_user_cards
+from .images import variant_urls
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read only {variant: url} map of an image field (e.g. source='post_image'),
+    only variants that have been generated are listed, "original" always is
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        # an empty FieldFile renders as null, like the image field itself
+        return variant_urls(value.name, self.context.get('request'))
+
 
 class ApplicationUserSerializer(serializers.ModelSerializer):
+    profile_image_variants = ImageVariantsField(source='profile_image')
 
     class Meta:
         model = ApplicationUser
-        fields = ['id','username','password','profile_image', 'user_gender',  'email','roles', 'followers_count', 'following_count', 'bio']
-    
+        fields = ['id','username','password','profile_image', 'profile_image_variants', 'user_gender',  'email','roles', 'followers_count', 'following_count', 'bio']
+        # the hash should never leave the server
+        extra_kwargs = {'password': {'write_only': True}}
+
+
+class UserCardField(serializers.Field):
+    """
+    Renders a user id (e.g. source='followers_id') as a compact user card.
+    When used under UserCardListSerializer the cards for the whole page are
+    loaded up front, otherwise they come from the per process card cache
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, user_id):
+        cards = self.context.get('user_cards') or {}
+        if user_id not in cards:
+            cards = get_user_cards([user_id], self.context.get('request'))
+        return cards.get(user_id)
+
+
+class UserCardListSerializer(serializers.ListSerializer):
+    """Batch loads every user card the page needs with one query before rendering"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        sources = [
+            field.source for field in self.child.fields.values()
+            if isinstance(field, UserCardField)
+        ]
+        user_ids = {getattr(item, source) for item in items for source in sources}
+        cards = self.context.setdefault('user_cards', {})
+        cards.update(get_user_cards(user_ids - cards.keys(), self.context.get('request')))
+        return super().to_representation(items)
+
 
 class FollowSerializer(serializers.ModelSerializer):
-    follower_details = ApplicationUserSerializer(source='followers', read_only=True)
-    following_details = ApplicationUserSerializer(source='following', read_only=True)
+    follower_details = UserCardField(source='followers_id')
+    following_details = UserCardField(source='following_id')
     
     class Meta:
         model = Follow
         fields = ['id', 'followers', 'following', 'created_at', 'follower_details', 'following_details']
         read_only_fields = ['created_at']
+        list_serializer_class = UserCardListSerializer
 
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.SerializerMethodField()
+    # filled in by the viewset's EXISTS annotations, False when not annotated
+    liked_by_me = serializers.BooleanField(read_only=True, default=False)
+    author_followed_by_me = serializers.BooleanField(read_only=True, default=False)
+    post_image_variants = ImageVariantsField(source='post_image')
 
     class Meta:
         model = Post
-        fields = ['id', 'user', 'author', 'post_title', 'post_description', 'post_date_created', 'post_image', 'like_count', 'comment_count']
+        fields = ['id', 'user', 'author', 'post_title', 'post_description', 'post_date_created', 'post_image', 'post_image_variants', 'like_count', 'comment_count', 'liked_by_me', 'author_followed_by_me']
 
     def get_author(self, obj):
         return obj.user.username if obj.user else None
@@ -41,7 +99,12 @@ class GeneratingPostSerializer(serializers.ModelSerializer):
 
     def get_all_posts(self, obj):
         request = self.context.get('request')
-        posts = Post.objects.all()
+        posts = with_viewer_state(
+            Post.objects.select_related('user'),
+            getattr(request, 'user', None),
+            PostLike,
+            'post',
+        )
         posts_data = []
 
         for post in posts:
@@ -54,7 +117,12 @@ class GeneratingPostSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         user = obj.user if hasattr(obj, 'user') else None
         if user:
-            posts = Post.objects.filter(user=user)
+            posts = with_viewer_state(
+                Post.objects.filter(user=user).select_related('user'),
+                getattr(request, 'user', None),
+                PostLike,
+                'post',
+            )
             posts_data = []
 
             for post in posts:
@@ -67,10 +135,13 @@ class GeneratingPostSerializer(serializers.ModelSerializer):
 
 
 class CommentSerializer(serializers.ModelSerializer):
+    liked_by_me = serializers.BooleanField(read_only=True, default=False)
+    author_followed_by_me = serializers.BooleanField(read_only=True, default=False)
+    comment_image_variants = ImageVariantsField(source='comment_image')
 
     class Meta:
         model = Comment
-        fields = ['id', 'user', 'post', 'parent_comment', 'comment_content', 'date_created', 'like_count','comment_image']
+        fields = ['id', 'user', 'post', 'parent_comment', 'comment_content', 'date_created', 'like_count','comment_image', 'comment_image_variants', 'liked_by_me', 'author_followed_by_me']
 
 
 class PostLikeSerializer(serializers.ModelSerializer):
@@ -116,10 +187,11 @@ class MoodCategorySerializer(serializers.ModelSerializer):
 
 class MoodSubcategorySerializer(serializers.ModelSerializer):
     category = MoodCategorySerializer()
+    mood_image_variants = ImageVariantsField(source='mood_image')
 
     class Meta:
         model = MoodSubcategory
-        fields = ['id', 'category', 'name', 'mood_image', 'description', 'mbti_insight']
+        fields = ['id', 'category', 'name', 'mood_image', 'mood_image_variants', 'description', 'mbti_insight']
 
 
 #class NoteSerializer(serializers.ModelSerializer):
@@ -129,10 +201,19 @@ class MoodSubcategorySerializer(serializers.ModelSerializer):
 #        fields = ['id', 'user', 'note_caption', 'note_content', 'note_date_created', 'time_spent', 'note_image', 'accountability_partner', 'achievements', 'mood_subcategory', 'Habit']
 
 class NoteSerializer(serializers.ModelSerializer):
+    note_image_variants = ImageVariantsField(source='note_image')
+
     class Meta:
         model = Note
-        fields = ['id', 'user', 'note_caption', 'note_content', 'note_date_created', 'time_spent', 'note_image', 'accountability_partner', 'achievements', 'mood_subcategory', 'Habit']
+        fields = ['id', 'user', 'note_caption', 'note_content', 'note_date_created', 'time_spent', 'note_image', 'note_image_variants', 'accountability_partner', 'achievements', 'mood_subcategory', 'Habit']
         read_only_fields = ['user']  # Make user read-only
+
+    def validate_accountability_partner(self, value):
+        # Note.save refuses this too, catching it here gives a 400 instead of a 500
+        request = self.context.get('request')
+        if value is not None and request is not None and value.pk == request.user.pk:
+            raise serializers.ValidationError("A user cannot be their own accountability partner.")
+        return value
     
     def create(self, validated_data):
         # Automatically sets the user from forntend request
@@ -142,18 +223,38 @@ class NoteSerializer(serializers.ModelSerializer):
     
     
 class JournalSerializer(serializers.ModelSerializer):
-    notes = serializers.SerializerMethodField()
+    """
+    Light journal row (caption, date, mood), the viewset select_related's the
+    mood so no row triggers an extra query
+    """
+    mood = serializers.SerializerMethodField()
+
     class Meta:
         model = Note
-        fields = ['id', 'notes']
-    def get_notes(self, obj):
-        request = self.context.get('request')
-        user = obj.user if hasattr(obj, 'user') else None 
-        if user:
-            notes = Note.objects.filter(user=user)
-            serializer = NoteSerializer(notes, many=True, context={'request': request})
-            return serializer.data
-        return []
+        fields = ['id', 'note_caption', 'note_date_created', 'time_spent', 'mood', 'Habit']
+
+    # only these columns are read for summary rows
+    summary_columns = [
+        'id', 'note_caption', 'note_date_created', 'time_spent', 'Habit',
+        'mood_subcategory__id', 'mood_subcategory__name', 'mood_subcategory__category__name',
+    ]
+
+    def get_mood(self, obj):
+        mood = obj.mood_subcategory
+        if mood is None:
+            return None
+        return {'id': mood.id, 'name': mood.name, 'category': mood.category.name}
+
+
+class JournalDetailSerializer(JournalSerializer):
+    """Journal row with the full note content, returned with ?full=1"""
+
+    class Meta(JournalSerializer.Meta):
+        fields = JournalSerializer.Meta.fields + [
+            'note_content', 'note_image', 'accountability_partner', 'achievements',
+        ]
+
+    summary_columns = None
 
 class HabitSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(
@@ -271,16 +372,11 @@ class AchievementSerializer(serializers.ModelSerializer):
         model = Achievement
         fields = ['id', 'user', 'achievement_type', 'ach_count', 'ach_date_earned']
 
-    def create(self, validated_data):
-        user = validated_data['user']
-        achievement_type = validated_data['achievement_type']
-        existing_achievement = Achievement.objects.filter(user=user, achievement_type=achievement_type).first()
-        if existing_achievement:
-            existing_achievement.ach_count += 1
-            existing_achievement.ach_date_earned = timezone.now()
-            existing_achievement.save()
-            return existing_achievement
-        return super().create(validated_data)
+    # no create() override, Achievement.save already turns a repeat award into
+    # an atomic ach_count increment on the existing row
+    # (the unique together validator is dropped so a repeat award is not a 400)
+    def get_validators(self):
+        return []
 
 
 
@@ -303,4 +399,19 @@ class WorkNoteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = WorkNote
-        fields = ['id', 'title', 'content', 'date_created', 'tasks']
\ No newline at end of file
+        fields = ['id', 'title', 'content', 'date_created', 'tasks']
+
+
+class WorkNoteSummarySerializer(serializers.ModelSerializer):
+    """
+    Work note with task totals instead of the tasks themselves, the numbers
+    are annotated by WorkNoteViewSet so this never touches the tasks table
+    """
+    task_count = serializers.IntegerField(read_only=True)
+    completed_count = serializers.IntegerField(read_only=True)
+    total_time = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = WorkNote
+        fields = ['id', 'title', 'content', 'date_created',
+                  'task_count', 'completed_count', 'total_time']
@@ -0,0 +1,207 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import achievements
+from .analytics import invalidate_mood_correlation
+from .cards import invalidate_user_card
+from .catalog import clear_catalog
+from .follow_graph import follow_graph
+from .images import image_names, queue_variants
+from .models import (
+    AchievementType, ApplicationUser, Comment, Follow, Habit, MediaBlob, MoodCategory, MoodSubcategory, Note, Post,
+)
+from .storage import is_hashed_name, take_reference
+
+# uploads that get resized variants, see images.py
+IMAGE_FIELDS = {
+    ApplicationUser: ["profile_image"],
+    Post: ["post_image"],
+    Comment: ["comment_image"],
+    Note: ["note_image"],
+    MoodSubcategory: ["mood_image"],
+}
+# every field whose files live in the content addressed storage
+MEDIA_FIELDS = {**IMAGE_FIELDS, AchievementType: ["achievement_type_image"]}
+
+
+@receiver(post_save, sender=ApplicationUser)
+@receiver(post_delete, sender=ApplicationUser)
+def drop_cached_user_card(sender, instance, **kwargs):
+    invalidate_user_card(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def add_follow_edge(sender, instance, created, **kwargs):
+    if created:
+        edge = (instance.followers_id, instance.following_id)
+        transaction.on_commit(lambda: follow_graph.add_edge(*edge))
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follow_edge(sender, instance, **kwargs):
+    edge = (instance.followers_id, instance.following_id)
+    transaction.on_commit(lambda: follow_graph.remove_edge(*edge))
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def drop_cached_mood_correlation(sender, instance, **kwargs):
+    invalidate_mood_correlation(instance.user_id)
+
+
+@receiver(post_save, sender=MoodCategory)
+@receiver(post_delete, sender=MoodCategory)
+@receiver(post_save, sender=MoodSubcategory)
+@receiver(post_delete, sender=MoodSubcategory)
+def drop_cached_catalog(sender, **kwargs):
+    clear_catalog()
+
+
+# achievement events, each reads one counter that is already maintained
+
+@receiver(post_save, sender=Note)
+def note_achievements(sender, instance, created, **kwargs):
+    if created:
+        count = ApplicationUser.objects.filter(pk=instance.user_id).values_list(
+            "note_count", flat=True
+        ).first() or 0
+        achievements.on_event(achievements.NOTE_CREATED, instance.user_id, count - 1, count)
+
+
+@receiver(post_save, sender=Follow)
+def follow_achievements(sender, instance, created, **kwargs):
+    if created:
+        count = ApplicationUser.objects.filter(pk=instance.following_id).values_list(
+            "followers_count", flat=True
+        ).first() or 0
+        achievements.on_event(achievements.FOLLOWED, instance.following_id, count - 1, count)
+
+
+@receiver(post_save, sender=Habit)
+def habit_achievements(sender, instance, created, **kwargs):
+    # an existing habit loaded without streak_count (.only(), deferred) has no
+    # snapshot, we cannot tell whether this save crossed anything so skip it
+    before = 0 if created else getattr(instance, "_saved_streak", None)
+    instance._saved_streak = instance.streak_count
+    if before is None or instance.streak_already_awarded():
+        return
+    if achievements.on_event(achievements.HABIT_COMPLETED, instance.user_id, before, instance.streak_count):
+        # remember the run, editing completions inside it cannot earn it again
+        instance.streak_awarded_on = instance.last_completed
+        Habit.objects.filter(pk=instance.pk).update(streak_awarded_on=instance.streak_awarded_on)
+
+
+def make_image_variants(sender, instance, update_fields=None, raw=False, **kwargs):
+    if not raw:
+        queue_variants(*image_names(instance, IMAGE_FIELDS[sender], update_fields))
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(make_image_variants, sender=model, dispatch_uid=f"image-variants-{model.__name__}")
+
+
+# media reference counts
+#
+# the signals below keep MediaBlob.ref_count right for save() and delete()
+# (queryset .delete() too, it sends post_delete per row). bulk_create,
+# bulk_update and queryset .update() send no post_save, code writing image
+# fields that way has to call count_bulk_media_references afterwards, anything
+# that slips past both is only repaired by `manage.py dedupe_media`.
+
+def _loaded_name(instance, field):
+    # read from __dict__ so a deferred field is never loaded just for this
+    value = instance.__dict__.get(field)
+    return getattr(value, "name", value) or None
+
+
+def remember_media(sender, instance, **kwargs):
+    instance._media_names = {
+        field: _loaded_name(instance, field)
+        for field in MEDIA_FIELDS[sender]
+        if field in instance.__dict__
+    }
+
+
+def count_media_references(sender, instance, created=False, update_fields=None, **kwargs):
+    names = getattr(instance, "_media_names", {})
+    for field, old in list(names.items()):
+        if update_fields is not None and field not in update_fields:
+            continue
+        if created:
+            # the snapshot of a new row is whatever it was constructed with
+            old = None
+        new = _loaded_name(instance, field)
+        if new == old:
+            # the same bytes uploaded again, hand back the storage's reference
+            if take_reference(new):
+                MediaBlob.release(new)
+            continue
+        # a freshly stored file was retained by the storage already
+        if is_hashed_name(new) and not take_reference(new):
+            MediaBlob.retain(new)
+        if is_hashed_name(old):
+            MediaBlob.release(old)
+        names[field] = new
+
+
+def count_bulk_media_references(objs, fields=None, created=False):
+    """
+    Retains / releases blobs for objects written with bulk_create or
+    bulk_update and queues variants for the new images, call it in the same
+    transaction right after the write.
+    Objects have to be model instances (the post_init snapshot is the old
+    value), for created objects every set image counts as new. fields limits
+    it to what the bulk_update wrote, like update_fields.
+    """
+    retained, released = Counter(), Counter()
+    new_images = set()
+    for obj in objs:
+        model_fields = MEDIA_FIELDS.get(type(obj), [])
+        names = getattr(obj, "_media_names", None)
+        if names is None:
+            names = obj._media_names = {}
+        for field in model_fields:
+            if fields is not None and field not in fields:
+                continue
+            # same as save(): a field deferred when the row was loaded has no old value
+            if field not in obj.__dict__ or (not created and field not in names):
+                continue
+            old = None if created else names[field]
+            new = _loaded_name(obj, field)
+            names[field] = new
+            if new == old:
+                if take_reference(new):
+                    released[new] += 1
+                continue
+            # make_image_variants is a post_save receiver, bulk writes get theirs here
+            if new and field in IMAGE_FIELDS.get(type(obj), ()):
+                new_images.add(new)
+            if is_hashed_name(new) and not take_reference(new):
+                retained[new] += 1
+            if is_hashed_name(old):
+                released[old] += 1
+    # one UPDATE per blob however many rows point at it
+    for name, count in retained.items():
+        MediaBlob.retain(name, count)
+    for name, count in released.items():
+        MediaBlob.release(name, count)
+    queue_variants(*sorted(new_images))
+
+
+def release_media(sender, instance, **kwargs):
+    for field in getattr(instance, "_media_names", {}):
+        name = _loaded_name(instance, field)
+        if is_hashed_name(name):
+            MediaBlob.release(name)
+
+
+for model in MEDIA_FIELDS:
+    uid = f"media-refs-{model.__name__}"
+    post_init.connect(remember_media, sender=model, dispatch_uid=uid)
+    post_save.connect(count_media_references, sender=model, dispatch_uid=uid)
+    post_delete.connect(release_media, sender=model, dispatch_uid=uid)
@@ -8,6 +8,7 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 import logging
 
+from .cards import get_user_cards
 from .models import AccountabilityPartner, Habit, ApplicationUser
 
 logger = logging.getLogger(__name__)
@@ -59,31 +60,21 @@ def accountability_stream(request):
 
 def get_partners_data(user):
     """Helper to serialize partner data"""
-    # Find all partnerships
-    partnerships = AccountabilityPartner.objects.filter(
+    # Find all partnerships, just the id pairs
+    pairs = AccountabilityPartner.objects.filter(
         (Q(user=user) | Q(partner=user)),
         is_active=True
-    )
-    
-    # Extract partner users
-    partners = []
-    for partnership in partnerships:
-        if partnership.user == user:
-            partners.append(partnership.partner)
-        else:
-            partners.append(partnership.user)
+    ).values_list('user_id', 'partner_id')
     
-    # Serialize to basic data
-    partners_data = []
-    for partner in partners:
-        partners_data.append({
-            'id': partner.id,
-            'username': partner.username,
-            'profile_image': partner.profile_image.url if partner.profile_image else None,
-            'email': partner.email,
-        })
+    # Extract partner ids
+    partner_ids = [
+        partner_id if user_id == user.id else user_id
+        for user_id, partner_id in pairs
+    ]
     
-    return partners_data
+    # Serialize to cards, loaded in one batch (or straight from the card cache)
+    cards = get_user_cards(partner_ids)
+    return [cards[pk] for pk in partner_ids if pk in cards]
 
 def check_for_partnership_changes(user, last_check):
     """Check for partnership changes since last check"""
@@ -121,12 +112,12 @@ def check_for_habit_changes(user, last_check):
     habit_changes = {}
     for habit in updated_habits:
         # Determine the partner_id for organizing the habits
-        if habit.user == user and habit.accountability_partner:
+        if habit.user_id == user.id and habit.accountability_partner_id:
             # User owns the habit, partner is the accountability partner
-            partner_id = habit.accountability_partner.id
-        elif habit.accountability_partner == user:
+            partner_id = habit.accountability_partner_id
+        elif habit.accountability_partner_id == user.id:
             # User is the accountability partner for this habit
-            partner_id = habit.user.id
+            partner_id = habit.user_id
         else:
             # User owns the habit but no accountability partner
             continue  
@@ -146,7 +137,7 @@ def check_for_habit_changes(user, last_check):
             'last_completed': habit.last_completed.isoformat() if habit.last_completed else None,
             'created_at': habit.created_at.isoformat(),
             'updated_at': habit.updated_at.isoformat(),
-            'accountability_partner': habit.accountability_partner.id if habit.accountability_partner else None
+            'accountability_partner': habit.accountability_partner_id
         }
         habit_changes[partner_id].append(habit_data)
     
@@ -171,5 +162,5 @@ def get_habit_data(habit):
         'last_completed': habit.last_completed.isoformat() if habit.last_completed else None,
         'created_at': habit.created_at.isoformat(),
         'updated_at': habit.updated_at.isoformat(),
-        'accountability_partner': habit.accountability_partner.id if habit.accountability_partner else None
+        'accountability_partner': habit.accountability_partner_id
     }
\ No newline at end of file
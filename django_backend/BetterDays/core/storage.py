@@ -0,0 +1,126 @@
+"""
+Content addressed media storage.
+
+Uploads are stored under the sha256 of their bytes (cas/ab/<hash>.jpg), so the
+same picture uploaded ten times is one file on disk and its URL never changes
+meaning. That is what lets media.py hand those URLs out with a year long
+immutable Cache-Control.
+
+Saving never overwrites anything different, a second copy of a blob is just
+not written. Blobs are only removed once no row points at them any more, the
+MediaBlob table counts the references (see signals.py). Files stored before
+this backend (plain names at the media root) are left alone, dedupe_media
+moves them over.
+
+Saving takes the row's reference itself, under a lock on the blob name that
+MediaBlob.collect holds while it deletes: reusing a file whose last reference
+is being dropped either keeps it alive or writes it back, it can never hand
+out a name whose file is about to go. The returned StoredName tells the
+post_save handler that the reference is already taken.
+"""
+
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import fcntl
+except ImportError:  # windows, single process dev server only
+    fcntl = None
+
+CAS_DIR = "cas"
+# lock files, one per hash prefix, dotted so media.py never serves them
+LOCK_DIR = ".locks"
+CHUNK_SIZE = 64 * 1024
+# extensions that mean the same thing are folded so the bytes decide the name
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg"}
+
+
+def is_hashed_name(name):
+    return bool(name) and name.replace("\\", "/").startswith(f"{CAS_DIR}/")
+
+
+def hashed_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    ext = EXTENSION_ALIASES.get(ext, ext)
+    return f"{CAS_DIR}/{digest[:2]}/{digest}{ext}"
+
+
+class StoredName(str):
+    """
+    Name returned by ContentAddressedStorage._save. It already holds one
+    MediaBlob reference, which the first row saved with it takes over.
+    """
+
+    retained = True
+
+
+def take_reference(name):
+    """True (once) when saving this name already counted the reference"""
+    if getattr(name, "retained", False):
+        name.retained = False
+        return True
+    return False
+
+
+@contextmanager
+def blob_lock(storage, name):
+    """Cross process lock on a blob name, held while it is reused or deleted"""
+    if fcntl is None or not is_hashed_name(name):
+        yield
+        return
+    directory = storage.path(LOCK_DIR)
+    os.makedirs(directory, exist_ok=True)
+    digest = os.path.basename(name)
+    with open(os.path.join(directory, f"{digest[:4]}.lock"), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # the final name comes from the content in _save, no need to look
+        # for a free one
+        return name
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        directory = self.path(CAS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        # hash while copying to a temp file so the upload is read once
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+            final = hashed_name(digest.hexdigest(), name)
+            path = self.path(final)
+            with blob_lock(self, final):
+                # reference first, then the file: a collect waiting on the lock
+                # sees the count above zero and leaves the file alone
+                MediaBlob.retain(final)
+                if os.path.exists(path):
+                    os.unlink(tmp)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp, self.file_permissions_mode)
+                    # same name means same bytes, so a concurrent save of the
+                    # same upload replacing this one is harmless
+                    os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return StoredName(final)
@@ -0,0 +1,141 @@
+"""
+Work task timers.
+
+Starting or stopping a timer appends a WorkTaskTimerEvent, reading the timer
+(the heartbeat the timer modal polls) only reads the pending events, so a
+running timer costs no writes at all. Closed sessions are folded into
+WorkTask.time_spent by flush_timers, one UPDATE with F() increments per batch.
+Stopping a timer queues a flush_work_timers job so that happens shortly after
+without cron.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Job, WorkTask, WorkTaskTimerEvent
+
+# stops within this many seconds of each other share one flush job
+FLUSH_DELAY = 60
+
+
+class TimerConflict(Exception):
+    pass
+
+
+def session_minutes(seconds):
+    # same rounding the timer modal always used: whole minutes, at least one
+    return max(1, int(seconds // 60))
+
+
+def fold_events(events):
+    """
+    Pairs the events of one task in time order, returns
+    (minutes, consumed_event_ids, open_start_event). Repeated starts and stray
+    stops are consumed without adding time.
+    """
+    minutes = 0
+    consumed = []
+    open_start = None
+    for event in events:
+        if event.kind == WorkTaskTimerEvent.START:
+            if open_start is None:
+                open_start = event
+            else:
+                consumed.append(event.id)
+        else:
+            consumed.append(event.id)
+            if open_start is not None:
+                minutes += session_minutes((event.at - open_start.at).total_seconds())
+                consumed.append(open_start.id)
+                open_start = None
+    return minutes, consumed, open_start
+
+
+def pending_events(task):
+    return list(WorkTaskTimerEvent.objects.filter(task=task, flushed=False).order_by("at", "id"))
+
+
+def timer_state(task, events=None, now=None):
+    """What the timer modal shows, time_spent includes sessions not flushed yet"""
+    now = now or timezone.now()
+    events = pending_events(task) if events is None else events
+    pending, _, open_start = fold_events(events)
+    return {
+        "task": task.id,
+        "running": open_start is not None,
+        "started_at": open_start.at if open_start else None,
+        "elapsed_seconds": int((now - open_start.at).total_seconds()) if open_start else 0,
+        "pending_minutes": pending,
+        "time_spent": task.time_spent + pending,
+    }
+
+
+def start_timer(task, user):
+    events = pending_events(task)
+    _, _, open_start = fold_events(events)
+    if open_start is None:
+        events.append(WorkTaskTimerEvent.objects.create(task=task, user=user, kind=WorkTaskTimerEvent.START))
+    return timer_state(task, events)
+
+
+def stop_timer(task, user):
+    events = pending_events(task)
+    _, _, open_start = fold_events(events)
+    if open_start is None:
+        raise TimerConflict("Timer is not running")
+    events.append(WorkTaskTimerEvent.objects.create(task=task, user=user, kind=WorkTaskTimerEvent.STOP))
+    Job.enqueue("flush_work_timers", dedup_key="flush_work_timers", delay=FLUSH_DELAY)
+    return timer_state(task, events)
+
+
+def flush_timers(batch_size=500):
+    """
+    Folds every closed session into time_spent, batch_size tasks at a time.
+    Returns (tasks_updated, minutes_added).
+    """
+    tasks_updated = minutes_added = 0
+    last_task = 0
+    while True:
+        task_ids = list(
+            WorkTaskTimerEvent.objects.filter(flushed=False, task_id__gt=last_task)
+            .order_by("task_id")
+            .values_list("task_id", flat=True)
+            .distinct()[:batch_size]
+        )
+        if not task_ids:
+            break
+        last_task = task_ids[-1]
+
+        events = {}
+        for event in WorkTaskTimerEvent.objects.filter(flushed=False, task_id__in=task_ids).order_by("at", "id"):
+            events.setdefault(event.task_id, []).append(event)
+
+        deltas = {}
+        consumed = []
+        for task_id, task_events in events.items():
+            minutes, used, _ = fold_events(task_events)
+            consumed.extend(used)
+            if minutes:
+                deltas[task_id] = minutes
+        if not consumed:
+            continue
+
+        with transaction.atomic():
+            # claim the events first, if another flush got to them the whole
+            # batch is rolled back rather than counted twice
+            claimed = WorkTaskTimerEvent.objects.filter(id__in=consumed, flushed=False).update(flushed=True)
+            if claimed != len(consumed):
+                transaction.set_rollback(True)
+                continue
+            if deltas:
+                WorkTask.objects.filter(pk__in=deltas).update(
+                    time_spent=F("time_spent") + Case(
+                        *[When(pk=pk, then=Value(minutes)) for pk, minutes in deltas.items()],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                )
+        tasks_updated += len(deltas)
+        minutes_added += sum(deltas.values())
+    return tasks_updated, minutes_added
@@ -0,0 +1,274 @@
+"""
+Resumable chunked image uploads.
+
+    POST   /api/uploads/                {filename, size, content_type, target, object_id}
+    PUT    /api/uploads/<id>/           raw bytes, Content-Range: bytes <start>-<end>/<size>
+    GET    /api/uploads/<id>/           how far the upload got, to resume from
+    POST   /api/uploads/<id>/finalize/  validates the image and attaches it
+    DELETE /api/uploads/<id>/           gives up
+
+Chunks are streamed from the request straight into a .part file a block at a
+time, so memory use does not depend on the chunk or file size. Chunks must
+arrive in order, a chunk that starts anywhere but the current offset is
+refused with the offset to continue from. A PUT claims the session before it
+writes anything, so two requests for the same range never write into the
+.part file at the same time, the second one gets a 409. Finalizing takes the
+same claim, a retried finalize gets a 409 (or 404 once the first is done). Size and type are checked when the
+session is created and again on the first bytes, so a wrong file is refused
+before most of it is sent.
+"""
+
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .images import variant_urls
+from .models import ApplicationUser, Comment, Note, Post, UploadSession
+
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# what clients are told to send, any size up to MAX_CHUNK_SIZE is accepted
+CHUNK_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+MAX_OPEN_SESSIONS = 5
+# a claim left behind by a worker that died mid chunk is ignored after this
+CHUNK_LOCK_TIMEOUT = timedelta(minutes=5)
+
+# target: (model, image field, how the owner is looked up)
+TARGETS = {
+    "post": (Post, "post_image", "user"),
+    "comment": (Comment, "comment_image", "user"),
+    "note": (Note, "note_image", "user"),
+    "profile": (ApplicationUser, "profile_image", "pk"),
+}
+
+# content type: (extension, leading bytes)
+SIGNATURES = {
+    "image/jpeg": (".jpg", [b"\xff\xd8\xff"]),
+    "image/png": (".png", [b"\x89PNG\r\n\x1a\n"]),
+    "image/gif": (".gif", [b"GIF87a", b"GIF89a"]),
+    "image/webp": (".webp", [b"RIFF"]),
+}
+SNIFF_BYTES = 12
+
+_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def sniff(header):
+    """Content type of an image from its first bytes, None if it is not one we take"""
+    for content_type, (_, prefixes) in SIGNATURES.items():
+        if any(header.startswith(prefix) for prefix in prefixes):
+            if content_type == "image/webp" and header[8:12] != b"WEBP":
+                continue
+            return content_type
+    return None
+
+
+def target_object(user, target, object_id):
+    """The row the upload will be attached to, it has to belong to the user"""
+    model, field, owner = TARGETS[target]
+    lookup = {owner: user.pk if owner == "pk" else user}
+    if object_id is not None and owner != "pk":
+        lookup["pk"] = object_id
+    elif object_id is not None and int(object_id) != user.pk:
+        raise UploadError("You can only change your own profile image", status=403)
+    instance = model.objects.filter(**lookup).first()
+    if instance is None:
+        raise UploadError(f"{target} {object_id} not found", status=404)
+    return instance
+
+
+def create_session(user, data):
+    target = data.get("target")
+    if target not in TARGETS:
+        raise UploadError(f"target must be one of {', '.join(TARGETS)}")
+    try:
+        size = int(data.get("size"))
+        object_id = data.get("object_id")
+        object_id = int(object_id) if object_id not in (None, "") else None
+    except (TypeError, ValueError):
+        raise UploadError("size and object_id must be integers")
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f"size must be between 1 and {MAX_UPLOAD_SIZE} bytes", status=413)
+    content_type = data.get("content_type")
+    if content_type not in SIGNATURES:
+        raise UploadError(f"content_type must be one of {', '.join(SIGNATURES)}", status=415)
+    filename = os.path.basename(str(data.get("filename") or "upload"))[:200]
+    if object_id is None and target != "profile":
+        raise UploadError("object_id is required")
+    instance = target_object(user, target, object_id)
+
+    UploadSession.purge_expired()
+    if UploadSession.objects.filter(user=user).count() >= MAX_OPEN_SESSIONS:
+        raise UploadError(f"At most {MAX_OPEN_SESSIONS} uploads can be open at once", status=429)
+    return UploadSession.objects.create(
+        user=user,
+        target=target,
+        object_id=instance.pk,
+        filename=filename,
+        content_type=content_type,
+        size=size,
+    )
+
+
+def session_state(session):
+    return {
+        "id": str(session.pk),
+        "target": session.target,
+        "object_id": session.object_id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.offset,
+        "complete": session.complete,
+        "chunk_size": CHUNK_SIZE,
+        "expires_at": session.expires_at,
+    }
+
+
+def parse_content_range(header, size):
+    match = _RANGE_RE.match(header or "")
+    if not match:
+        raise UploadError("Content-Range: bytes <start>-<end>/<size> is required")
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or end < start or end >= size:
+        raise UploadError("Content-Range does not fit this upload", status=416)
+    if end - start + 1 > MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunks can be at most {MAX_CHUNK_SIZE} bytes", status=413)
+    return start, end - start + 1
+
+
+def claim_session(session, offset=None, complete=False):
+    """
+    Locks the session for one chunk write (at offset) or for finalizing (it
+    has to be complete), with a conditional UPDATE so only one request wins.
+    Returns the claim token, raises 409 / 404 when the claim is not possible.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    rows = UploadSession.objects.filter(pk=session.pk).filter(
+        Q(locked_at__isnull=True) | Q(locked_at__lt=now - CHUNK_LOCK_TIMEOUT)
+    )
+    rows = rows.filter(offset=F("size")) if complete else rows.filter(offset=offset)
+    if rows.update(locked_at=now, locked_by=token):
+        session.locked_by = token
+        return token
+
+    current = UploadSession.objects.filter(pk=session.pk).values_list("offset", "size").first()
+    if current is None:
+        raise UploadError("Upload not found", status=404)
+    session.offset = current[0]
+    if complete and current[0] != current[1]:
+        raise UploadError("Upload is not complete", status=409, offset=current[0])
+    if not complete and current[0] != offset:
+        raise UploadError("Chunk does not start at the current offset", status=409, offset=current[0])
+    raise UploadError("This upload is busy, another request is writing or finalizing it", status=409, offset=current[0])
+
+
+def release_session(session, offset=None):
+    """Drops our claim, for a chunk write together with the new offset"""
+    changes = {"locked_at": None, "locked_by": ""}
+    if offset is not None:
+        changes["offset"] = offset
+        session.offset = offset
+    UploadSession.objects.filter(pk=session.pk, locked_by=session.locked_by).update(**changes)
+    session.locked_by = ""
+
+
+def write_chunk(session, content_range, stream, content_length=None):
+    """
+    Appends one chunk at the session's offset, reading the body in READ_SIZE
+    blocks. Returns the new offset, a chunk cut short still keeps what arrived
+    so the client resumes from there.
+    """
+    start, length = parse_content_range(content_range, session.size)
+    if start != session.offset:
+        raise UploadError("Chunk does not start at the current offset", status=409, offset=session.offset)
+    if content_length is not None and content_length != length:
+        raise UploadError("Content-Length does not match Content-Range")
+
+    # claim the range before touching the file, a request racing for the same
+    # offset finds the claim taken (or the offset moved) and never writes
+    claim_session(session, offset=start)
+
+    path = session.part_path
+    written = 0
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as out:
+            # anything past the confirmed offset is from a chunk that never finished
+            out.seek(start)
+            out.truncate()
+            while written < length and stream is not None:
+                block = stream.read(min(READ_SIZE, length - written))
+                if not block:
+                    break
+                out.write(block)
+                written += len(block)
+    finally:
+        # whatever arrived is kept, even when the client went away mid chunk
+        offset = start + written
+        release_session(session, offset=offset)
+
+    if start < SNIFF_BYTES and (offset >= SNIFF_BYTES or offset == session.size):
+        with open(path, "rb") as fh:
+            detected = sniff(fh.read(SNIFF_BYTES))
+        if detected is None:
+            session.delete()
+            raise UploadError("The file is not a jpeg, png, gif or webp image", status=415)
+        if detected != session.content_type:
+            UploadSession.objects.filter(pk=session.pk).update(content_type=detected)
+            session.content_type = detected
+    if written < length:
+        raise UploadError("Chunk ended early", offset=offset)
+    return offset
+
+
+def finalize(session, request=None):
+    """Checks the whole file with Pillow and saves it into the target image field"""
+    claim_session(session, complete=True)
+    path = session.part_path
+    try:
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError, SyntaxError):
+            session.delete()
+            raise UploadError("The file is not a valid image", status=415)
+
+        _, field, _ = TARGETS[session.target]
+        instance = target_object(session.user, session.target, session.object_id)
+        stem = os.path.splitext(session.filename)[0] or "upload"
+        name = stem + SIGNATURES[session.content_type][0]
+        with transaction.atomic():
+            with open(path, "rb") as fh:
+                getattr(instance, field).save(name, File(fh), save=False)
+            instance.save(update_fields=[field])
+            session.delete()
+    except BaseException:
+        release_session(session)
+        raise
+
+    stored = getattr(instance, field)
+    url = stored.url
+    return {
+        "target": session.target,
+        "object_id": instance.pk,
+        "field": field,
+        "name": stored.name,
+        "url": request.build_absolute_uri(url) if request is not None else url,
+        "variants": variant_urls(stored.name, request),
+    }
@@ -1,8 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views, api_views
-from django.conf import settings
-from django.conf.urls.static import static
 
 # Setup DRF router for HabitViewSet
 router = DefaultRouter()
@@ -21,6 +19,4 @@ urlpatterns = [
     
     # Include all DRF router URLs under /api/
     path("api/", include(router.urls)),  
-]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
\ No newline at end of file
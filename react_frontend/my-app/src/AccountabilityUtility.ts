@@ -5,7 +5,7 @@ export interface Partner {
   id: number;
   username: string;
   profile_image?: string;
-  email: string;
+  email?: string;
 }
 
 export interface Habit {
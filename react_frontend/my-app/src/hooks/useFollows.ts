@@ -9,23 +9,23 @@ interface Follow {
     id: number;
     username: string;
     profile_image: string | null;
-    user_gender: string;
-    email: string;
-    roles: string;
-    followers_count: number;
-    following_count: number;
-    bio: string | null;
+    user_gender?: string;
+    email?: string;
+    roles?: string;
+    followers_count?: number;
+    following_count?: number;
+    bio?: string | null;
   };
   following_details: {
     id: number;
     username: string;
     profile_image: string | null;
-    user_gender: string;
-    email: string;
-    roles: string;
-    followers_count: number;
-    following_count: number;
-    bio: string | null;
+    user_gender?: string;
+    email?: string;
+    roles?: string;
+    followers_count?: number;
+    following_count?: number;
+    bio?: string | null;
   };
   created_at: string;
 }